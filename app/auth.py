@@ -1,15 +1,23 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlmodel import Session, select, update
 from pathlib import Path
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from typing import Optional
+import asyncio
+import hmac
 import os
+import threading
+import time
 
 from app.db import engine
-from app.models import User
+from app import cache, scoreboard
+from app.models import User, UserStats
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent / "templates"))
@@ -18,6 +26,26 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# cache ของ user ที่ login อยู่ (ไม่ต้อง query ตาราง user ทุก request)
+USER_CACHE_TTL_S = float(os.getenv("GRADER_USER_CACHE_TTL_S", "60"))
+USER_CACHE_SIZE = int(os.getenv("GRADER_USER_CACHE_SIZE", "1024"))
+
+# เวลาสูงสุดที่ยอมให้ init_users ใช้ hash รหัสผ่านตอน startup บัญชีที่ไม่ทันจะถูก hash ตอน login ครั้งแรก
+SEED_BUDGET_S = float(os.getenv("GRADER_SEED_BUDGET_S", "5"))
+SEED_WORKERS = int(os.getenv("GRADER_SEED_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# ตรวจรหัสผ่าน (bcrypt) ใน pool แยก ไม่แย่ง threadpool ของ request อื่นตอนทุกคน login พร้อมกัน
+LOGIN_WORKERS = int(os.getenv("GRADER_LOGIN_WORKERS", "0")) or (os.cpu_count() or 1)
+# login ที่รอคิวเกินนี้จะได้ 503 ทันทีแทนที่จะรอนาน
+LOGIN_QUEUE_MAX = int(os.getenv("GRADER_LOGIN_QUEUE_MAX", "200"))
+
+_login_pool = ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="login")
+_login_lock = threading.Lock()
+_login_stats = {"waiting": 0, "running": 0, "completed": 0, "rejected": 0, "max_waiting": 0,
+                "verify_ms_total": 0.0, "verify_ms_max": 0.0}
+
+_user_cache = OrderedDict()  # username -> (expires_at, User)
+_user_cache_lock = threading.Lock()
 
 # Predefined users
 PREDEFINED_USERS = {
@@ -91,14 +119,95 @@ def get_user_by_username(username: str):
     with Session(engine) as session:
         return session.exec(select(User).where(User.username == username)).first()
 
+def get_cached_user(username: str):
+    """get_user_by_username through a small TTL/LRU cache.
+
+    The returned User is shared between requests and must not be modified;
+    call invalidate_user() after changing a user in the database.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(username)
+        if entry and entry[0] > now:
+            _user_cache.move_to_end(username)
+            return entry[1]
+    user = get_user_by_username(username)
+    if user:
+        with _user_cache_lock:
+            _user_cache[username] = (now + USER_CACHE_TTL_S, user)
+            _user_cache.move_to_end(username)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+    return user
+
+def invalidate_user(username: Optional[str] = None):
+    """Drop one user (or everyone when username is None) from the cache."""
+    with _user_cache_lock:
+        if username is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(username, None)
+
 def authenticate_user(username: str, password: str):
     user = get_user_by_username(username)
     if not user:
         return False
+    if not user.password_hash:
+        return _finish_deferred_user(user, password)
     if not verify_password(password, user.password_hash):
         return False
     return user
 
+def _finish_deferred_user(user: User, password: str):
+    """First login of a predefined account whose hash was deferred at startup: check and store the hash."""
+    predefined = PREDEFINED_USERS.get(user.username)
+    if not predefined or not hmac.compare_digest(password.encode(), predefined["password"].encode()):
+        return False
+    with Session(engine) as session:
+        db_user = session.get(User, user.id)
+        db_user.password_hash = get_password_hash(password)
+        session.add(db_user)
+        session.commit()
+        session.refresh(db_user)
+    invalidate_user(user.username)
+    return db_user
+
+def _authenticate_in_pool(username: str, password: str):
+    with _login_lock:
+        _login_stats["waiting"] -= 1
+        _login_stats["running"] += 1
+    started = time.perf_counter()
+    try:
+        return authenticate_user(username, password)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _login_lock:
+            _login_stats["running"] -= 1
+            _login_stats["completed"] += 1
+            _login_stats["verify_ms_total"] += elapsed_ms
+            _login_stats["verify_ms_max"] = max(_login_stats["verify_ms_max"], elapsed_ms)
+
+async def authenticate_user_async(username: str, password: str):
+    """authenticate_user on the bounded login pool; returns None when the queue is full."""
+    with _login_lock:
+        if _login_stats["waiting"] >= LOGIN_QUEUE_MAX:
+            _login_stats["rejected"] += 1
+            return None
+        _login_stats["waiting"] += 1
+        _login_stats["max_waiting"] = max(_login_stats["max_waiting"], _login_stats["waiting"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_login_pool, _authenticate_in_pool, username, password)
+
+def login_stats() -> dict:
+    """Queue depth and timing of the login pool (for the admin stats endpoint)."""
+    with _login_lock:
+        stats = dict(_login_stats)
+    completed = stats.pop("verify_ms_total")
+    stats["verify_ms_avg"] = round(completed / stats["completed"], 1) if stats["completed"] else 0.0
+    stats["verify_ms_max"] = round(stats["verify_ms_max"], 1)
+    stats["workers"] = LOGIN_WORKERS
+    return stats
+
 def get_current_user(request: Request):
     token = request.cookies.get("access_token")
     if not token:
@@ -108,31 +217,77 @@ def get_current_user(request: Request):
         username: str = payload.get("sub")
         if username is None:
             return None
-        return get_user_by_username(username)
+        return get_cached_user(username)
     except JWTError:
         return None
 
+def _hash_within_budget(passwords: dict) -> dict:
+    """Hash {username: password} in a process pool until SEED_BUDGET_S runs out.
+
+    Returns the hashes that finished; the rest stay unhashed and are
+    hashed on first login (see _finish_deferred_user).
+    """
+    if not passwords:
+        return {}
+    hashes = {}
+    pool = ProcessPoolExecutor(max_workers=min(SEED_WORKERS, len(passwords)))
+    try:
+        futures = {pool.submit(get_password_hash, pw): username for username, pw in passwords.items()}
+        for future in as_completed(futures, timeout=SEED_BUDGET_S):
+            hashes[futures[future]] = future.result()
+    except FutureTimeout:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return hashes
+
 def init_users():
+    started = time.perf_counter()
     with Session(engine) as session:
-        for username, data in PREDEFINED_USERS.items():
-            existing = session.exec(select(User).where(User.username == username)).first()
-            if not existing:
-                user = User(
-                    username=username,
-                    password_hash=get_password_hash(data["password"]),
-                    display_name=username,
-                    is_admin=data["is_admin"]
+        # query เดียวสำหรับทุกบัญชี แทนการ SELECT ทีละคน
+        existing = dict(session.exec(
+            select(User.username, User.password_hash).where(User.username.in_(list(PREDEFINED_USERS)))
+        ).all())
+        # บัญชีใหม่ และบัญชีที่ยัง hash ไม่เสร็จจากการ start ครั้งก่อน
+        pending = {username: data["password"] for username, data in PREDEFINED_USERS.items()
+                   if not existing.get(username)}
+        hashes = _hash_within_budget(pending)
+        
+        new_users = [
+            User(
+                username=username,
+                password_hash=hashes.get(username, ""),
+                display_name=username,
+                is_admin=PREDEFINED_USERS[username]["is_admin"]
+            )
+            for username in pending if username not in existing
+        ]
+        session.add_all(new_users)
+        for username in pending:
+            if username in existing and username in hashes:
+                session.execute(
+                    update(User).where(User.username == username).values(password_hash=hashes[username])
                 )
-                session.add(user)
         session.commit()
+    invalidate_user()
+    
+    elapsed = time.perf_counter() - started
+    deferred = len(pending) - len(hashes)
+    print(f"init_users: {len(new_users)} created, {len(hashes)} hashed, {deferred} deferred to first login in {elapsed:.2f}s")
 
 @router.get("/login", response_class=HTMLResponse)
 def login_form(request: Request, user: User = Depends(get_current_user)):
     return templates.TemplateResponse("login.html", {"request": request, "user": user})
 
 @router.post("/login")
-def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    user = authenticate_user(username, password)
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    user = await authenticate_user_async(username, password)
+    if user is None:
+        return templates.TemplateResponse("login.html", {
+            "request": request, 
+            "user": None,
+            "error": "Too many logins at once, please try again in a moment"
+        }, status_code=503)
     if not user:
         return templates.TemplateResponse("login.html", {
             "request": request, 
@@ -145,6 +300,14 @@ def login(request: Request, username: str = Form(...), password: str = Form(...)
     response.set_cookie(key="access_token", value=access_token, httponly=True)
     return response
 
+@router.get("/stats")
+def auth_stats(current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view auth stats")
+    with _user_cache_lock:
+        cached_users = len(_user_cache)
+    return JSONResponse({"login": login_stats(), "user_cache": {"entries": cached_users}})
+
 @router.get("/logout")
 def logout():
     response = RedirectResponse(url="/", status_code=303)
@@ -155,9 +318,12 @@ def logout():
 def profile(request: Request, current_user: User = Depends(get_current_user)):
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
+    with Session(engine) as session:
+        stats = session.exec(select(UserStats).where(UserStats.user_id == current_user.id)).first()
     return templates.TemplateResponse("profile.html", {
         "request": request, 
-        "user": current_user
+        "user": current_user,
+        "stats": stats
     })
 
 @router.post("/change-name")
@@ -182,5 +348,8 @@ def change_name(
         user.name_changes_left -= 1
         session.add(user)
         session.commit()
+    invalidate_user(current_user.username)
+    scoreboard.refresh_user(current_user.id)
+    cache.bump("users")
     
     return RedirectResponse(url="/auth/profile", status_code=303)
\ No newline at end of file
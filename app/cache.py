@@ -0,0 +1,69 @@
+"""Versioned cache for rendered page fragments.
+
+A fragment is stored together with the versions of the topics it was
+rendered from. Code that changes the underlying data bumps the topic (the
+judge when a verdict lands, problem uploads, name changes) and the next
+request renders it again; nothing expires by time. Concurrent requests
+for a stale fragment wait for a single render instead of each rendering.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable
+
+MAX_ENTRIES = int(os.getenv("GRADER_FRAGMENT_CACHE_SIZE", "2000"))
+
+_lock = threading.Lock()
+_versions = {}
+_fragments = OrderedDict()
+_render_locks = {}
+_stats = {"hits": 0, "renders": 0}
+
+def bump(*topics: Hashable):
+    """Mark every fragment rendered from these topics as stale."""
+    with _lock:
+        for topic in topics:
+            _versions[topic] = _versions.get(topic, 0) + 1
+
+def _stamp(topics: Iterable[Hashable]) -> tuple:
+    return tuple(_versions.get(topic, 0) for topic in topics)
+
+def _lookup(key: Hashable, stamp: tuple):
+    entry = _fragments.get(key)
+    if entry is not None and entry[0] == stamp:
+        _fragments.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[1]
+    return None
+
+def get_or_render(key: Hashable, topics: Iterable[Hashable], render: Callable[[], str]) -> str:
+    """Cached fragment for key, calling render() only when one of topics was bumped since it was stored."""
+    topics = tuple(topics)
+    with _lock:
+        stamp = _stamp(topics)
+        html = _lookup(key, stamp)
+        if html is not None:
+            return html
+        key_lock = _render_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            # อาจมี request อื่น render เสร็จไปแล้วระหว่างที่รอ lock
+            stamp = _stamp(topics)
+            html = _lookup(key, stamp)
+            if html is not None:
+                return html
+        # version ถูกอ่านก่อน render: ถ้ามี bump ระหว่าง render ผลนี้จะถูก render ใหม่ใน request ถัดไป
+        html = render()
+        with _lock:
+            _fragments[key] = (stamp, html)
+            _fragments.move_to_end(key)
+            _stats["renders"] += 1
+            while len(_fragments) > MAX_ENTRIES:
+                old_key, _ = _fragments.popitem(last=False)
+                _render_locks.pop(old_key, None)
+    return html
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats, entries=len(_fragments))
@@ -1,10 +1,41 @@
 from sqlmodel import SQLModel, create_engine
+from sqlalchemy import event
 from pathlib import Path
 import os
 import sqlite3
 
 DB_PATH = os.getenv("GRADER_DB_PATH") or str(Path(__file__).resolve().parent.parent / "grader.db")
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
+# WAL: ผู้อ่านไม่ถูก block ระหว่างที่ judge เขียนผล (ใช้ DELETE ถ้า DB อยู่บน network filesystem)
+JOURNAL_MODE = os.getenv("GRADER_SQLITE_JOURNAL", "WAL")
+# รอ lock ได้นานเท่านี้ก่อนจะได้ "database is locked"
+BUSY_TIMEOUT_MS = int(os.getenv("GRADER_SQLITE_BUSY_TIMEOUT_MS", "10000"))
+CACHE_SIZE_KB = int(os.getenv("GRADER_SQLITE_CACHE_KB", "32768"))
+POOL_SIZE = int(os.getenv("GRADER_DB_POOL_SIZE", "10"))
+POOL_OVERFLOW = int(os.getenv("GRADER_DB_POOL_OVERFLOW", "20"))
+
+engine = create_engine(
+    f"sqlite:///{DB_PATH}",
+    echo=False,
+    connect_args={"timeout": BUSY_TIMEOUT_MS / 1000},
+    # แต่ละ request / judge worker ยืม connection ไปหนึ่งอัน
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_OVERFLOW,
+)
+
+
+def configure_connection(conn: sqlite3.Connection):
+    """Per-connection pragmas; journal_mode=WAL is persisted in the file, the rest are not."""
+    conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    # NORMAL ปลอดภัยกับ WAL (อาจเสีย transaction ล่าสุดถ้าไฟดับ แต่ไฟล์ไม่เสีย) และ fsync น้อยกว่ามาก
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    configure_connection(dbapi_connection)
 
 
 def _ensure_columns(conn: sqlite3.Connection, table: str, columns: dict):
@@ -15,38 +46,199 @@ def _ensure_columns(conn: sqlite3.Connection, table: str, columns: dict):
             conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
 
 
+def _backfill_best_scores(conn: sqlite3.Connection):
+    """Fill bestscore from existing submissions the first time it is empty; the judge keeps it up to date afterwards."""
+    if conn.execute("SELECT 1 FROM bestscore LIMIT 1").fetchone():
+        return
+    conn.execute("""
+    INSERT INTO bestscore (user_id, problem_id, best_score, max_score, attempts, improved_at)
+    SELECT user_id, problem_id, MAX(score), MAX(max_score), COUNT(*), MIN(created_at)
+    FROM submission
+    WHERE status NOT IN ('queued', 'running') AND user_id IS NOT NULL
+    GROUP BY user_id, problem_id
+    """)
+    _recompute_improved_at(conn)
+
+
+def _recompute_improved_at(conn: sqlite3.Connection):
+    """improved_at = submit time of the earliest judged submission that reached best_score (same rule as the judge)."""
+    conn.execute("""
+    UPDATE bestscore SET improved_at = COALESCE((
+        SELECT MIN(s.created_at) FROM submission s
+        WHERE s.user_id = bestscore.user_id AND s.problem_id = bestscore.problem_id
+          AND s.status NOT IN ('queued', 'running') AND s.score = bestscore.best_score
+    ), improved_at)
+    """)
+
+
+def _backfill_user_stats(conn: sqlite3.Connection):
+    """Fill userstats from bestscore the first time it has no user_id rows; the judge keeps it up to date afterwards."""
+    if conn.execute("SELECT 1 FROM userstats WHERE user_id IS NOT NULL LIMIT 1").fetchone():
+        return
+    # แถวเก่าที่ไม่มี user_id ไม่เคยถูกเขียนจากที่ไหน ลบทิ้งแล้วสร้างใหม่
+    conn.execute("DELETE FROM userstats")
+    conn.execute("""
+    INSERT INTO userstats (user_id, user_name, total_score, total_submissions, problems_solved, last_activity)
+    SELECT b.user_id, u.username, SUM(b.best_score), SUM(b.attempts),
+           SUM(b.max_score > 0 AND b.best_score >= b.max_score),
+           (SELECT MAX(s.updated_at) FROM submission s WHERE s.user_id = b.user_id)
+    FROM bestscore b JOIN user u ON u.id = b.user_id
+    GROUP BY b.user_id
+    """)
+
+
+def _migration_1_baseline(conn: sqlite3.Connection):
+    """columns added over time, userstats and bestscore backfill"""
+    # submission columns
+    _ensure_columns(conn, "submission", {
+        "user_id": "INTEGER",
+        "user_name": "TEXT",
+        "score": "INTEGER DEFAULT 0",
+        "max_score": "INTEGER DEFAULT 100",
+        "passed_tests": "INTEGER DEFAULT 0",
+        "total_tests": "INTEGER DEFAULT 0",
+        "penalty": "INTEGER DEFAULT 0",
+        "memory_used_kb": "INTEGER",
+        "test_results": "TEXT",
+    })
+    # problem columns
+    _ensure_columns(conn, "problem", {
+        "description": "TEXT",
+        "pdf_path": "TEXT",
+        "max_score": "INTEGER DEFAULT 100",
+        "testcase_count": "INTEGER DEFAULT 0",
+        "checker": "TEXT DEFAULT 'exact'",
+    })
+    # userstats table (create if not exists)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS userstats (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        user_name TEXT UNIQUE,
+        total_score INTEGER DEFAULT 0,
+        total_submissions INTEGER DEFAULT 0,
+        problems_solved INTEGER DEFAULT 0,
+        last_activity TIMESTAMP
+    )
+    """)
+    _ensure_columns(conn, "userstats", {
+        "user_id": "INTEGER",
+    })
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_userstats_user_id ON userstats (user_id)")
+    # best score ต่อ (user, problem) ของ leaderboard
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submission_user_problem ON submission (user_id, problem_id)")
+    _backfill_best_scores(conn)
+    _backfill_user_stats(conn)
+
+
+def _migration_2_indexes(conn: sqlite3.Connection):
+    """indexes for the judge queue and the submission listings"""
+    # judge: สแกนหา queued/running ตอน start และเรียงตาม id
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submission_status_id ON submission (status, id)")
+    # หน้า my submissions / submission ของโจทย์หนึ่ง เรียงจากใหม่ไปเก่า
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submission_user_id ON submission (user_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submission_problem_id ON submission (problem_id, id)")
+    # user_id เป็นคอลัมน์แรกของ unique (user_id, problem_id) อยู่แล้ว index เดี่ยวนี้ซ้ำซ้อน
+    conn.execute("DROP INDEX IF EXISTS ix_bestscore_user_id")
+    # user.username มี index จาก UNIQUE constraint อยู่แล้ว
+    conn.execute("ANALYZE")
+
+
+def _migration_3_testcase_version(conn: sqlite3.Connection):
+    """testcase set version each submission was judged against"""
+    # NULL = ยังไม่ได้ตรวจ (หรือ rerun กับชุดปัจจุบัน), 0 = ชุดเดิมก่อนมีการแยก version
+    _ensure_columns(conn, "submission", {"testcase_version": "INTEGER"})
+    # submission ที่ตรวจไปแล้วทั้งหมดใช้ testcase ชุดเดิมในโฟลเดอร์ของโจทย์
+    conn.execute(
+        "UPDATE submission SET testcase_version = 0 "
+        "WHERE testcase_version IS NULL AND status NOT IN ('queued', 'running')"
+    )
+
+
+def _migration_4_pdf_metadata(conn: sqlite3.Connection):
+    """statement PDF size, content hash and page count"""
+    # โจทย์เก่าถูกคำนวณตอนเปิด PDF ครั้งแรก (ดู routers/problems.py)
+    _ensure_columns(conn, "problem", {
+        "pdf_size": "INTEGER",
+        "pdf_sha256": "TEXT",
+        "pdf_pages": "INTEGER",
+    })
+
+
+def _migration_5_rejudge_batches(conn: sqlite3.Connection):
+    """bulk rejudge batch column and progress index"""
+    # ตาราง rejudgebatch ถูกสร้างโดย create_all
+    _ensure_columns(conn, "submission", {"rejudge_batch_id": "INTEGER"})
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submission_rejudge_batch ON submission (rejudge_batch_id, status)")
+
+
+def _migration_6_queue_wait(conn: sqlite3.Connection):
+    """time each submission waited in the judge queue"""
+    _ensure_columns(conn, "submission", {"queue_wait_ms": "INTEGER"})
+
+
+def _migration_7_improved_at_from_submit_time(conn: sqlite3.Connection):
+    """bestscore tie-break time taken from submission times instead of verdict times"""
+    _recompute_improved_at(conn)
+
+
+def _migration_8_waiting_scores_count(conn: sqlite3.Connection):
+    """bestscore counts the previous score of submissions waiting to be rejudged"""
+    # กฎเดียวกับ runner._update_best_score: best_score และ improved_at คิดจากทุกแถวของคู่ (user, problem)
+    # ส่วน attempts ยังนับเฉพาะแถวที่ตรวจแล้วเหมือนเดิม
+    conn.execute("""
+    UPDATE bestscore SET best_score = COALESCE((
+        SELECT MAX(s.score) FROM submission s
+        WHERE s.user_id = bestscore.user_id AND s.problem_id = bestscore.problem_id
+    ), best_score)
+    """)
+    conn.execute("""
+    UPDATE bestscore SET improved_at = COALESCE((
+        SELECT MIN(s.created_at) FROM submission s
+        WHERE s.user_id = bestscore.user_id AND s.problem_id = bestscore.problem_id
+          AND s.score = bestscore.best_score
+    ), improved_at)
+    """)
+    conn.execute("""
+    UPDATE userstats SET
+        total_score = (SELECT COALESCE(SUM(b.best_score), 0) FROM bestscore b WHERE b.user_id = userstats.user_id),
+        problems_solved = (SELECT COALESCE(SUM(b.max_score > 0 AND b.best_score >= b.max_score), 0)
+                           FROM bestscore b WHERE b.user_id = userstats.user_id)
+    WHERE user_id IS NOT NULL
+    """)
+
+
+# schema migrations ตามลำดับ: migration ที่ n ทำให้ PRAGMA user_version เป็น n
+# ทุก migration ต้องรันซ้ำได้ (IF NOT EXISTS / _ensure_columns) เพราะ DB ใหม่ถูกสร้างด้วย create_all ก่อน
+# ห้ามแก้ migration ที่ปล่อยไปแล้ว ให้เพิ่มอันใหม่ต่อท้ายแทน
+MIGRATIONS = [
+    _migration_1_baseline,
+    _migration_2_indexes,
+    _migration_3_testcase_version,
+    _migration_4_pdf_metadata,
+    _migration_5_rejudge_batches,
+    _migration_6_queue_wait,
+    _migration_7_improved_at_from_submit_time,
+    _migration_8_waiting_scores_count,
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
 def migrate_sqlite_if_needed():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
     try:
-        # submission columns
-        _ensure_columns(conn, "submission", {
-            "user_id": "INTEGER",
-            "user_name": "TEXT",
-            "score": "INTEGER DEFAULT 0",
-            "max_score": "INTEGER DEFAULT 100",
-            "passed_tests": "INTEGER DEFAULT 0",
-            "total_tests": "INTEGER DEFAULT 0",
-            "penalty": "INTEGER DEFAULT 0",
-        })
-        # problem columns
-        _ensure_columns(conn, "problem", {
-            "description": "TEXT",
-            "pdf_path": "TEXT",
-            "max_score": "INTEGER DEFAULT 100",
-            "testcase_count": "INTEGER DEFAULT 0",
-        })
-        # userstats table (create if not exists)
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS userstats (
-            id INTEGER PRIMARY KEY,
-            user_name TEXT UNIQUE,
-            total_score INTEGER DEFAULT 0,
-            total_submissions INTEGER DEFAULT 0,
-            problems_solved INTEGER DEFAULT 0,
-            last_activity TIMESTAMP
-        )
-        """)
-        conn.commit()
+        configure_connection(conn)
+        version = schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number <= version:
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            print(f"DB: applied migration {number} ({migration.__doc__})")
     finally:
         conn.close()
 
@@ -0,0 +1,125 @@
+import os
+from itertools import zip_longest
+from typing import BinaryIO, Iterator, Tuple
+
+# โหมดการตรวจคำตอบ
+#   exact  - เทียบทีละบรรทัด ไม่สนช่องว่างท้ายบรรทัด และบรรทัดว่างต้น/ท้ายไฟล์
+#   tokens - เทียบทีละ token ที่คั่นด้วย whitespace
+#   float  - เหมือน tokens แต่ตัวเลขทศนิยมยอมให้คลาดเคลื่อนได้ FLOAT_TOLERANCE
+MODES = ("exact", "tokens", "float")
+DEFAULT_MODE = "exact"
+CHUNK_SIZE = 64 * 1024
+OUTPUT_LIMIT_BYTES = int(os.getenv("GRADER_OUTPUT_LIMIT_MB", "64")) * 1024 * 1024
+FLOAT_TOLERANCE = 1e-6
+
+_WHITESPACE = b" \t\r\n\f\v"
+_PREVIEW = 40
+
+class OutputLimitExceeded(Exception):
+    pass
+
+def _chunks(stream: BinaryIO, limit: int = 0) -> Iterator[bytes]:
+    total = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        total += len(chunk)
+        if limit and total > limit:
+            raise OutputLimitExceeded(f"output limit exceeded ({limit} bytes)")
+        yield chunk
+
+def _lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Lines with trailing whitespace removed; leading and trailing blank lines are dropped."""
+    started = False
+    blank = 0
+    pending = []  # ชิ้นของบรรทัดที่ยังไม่จบ (ต่อกันทีเดียวตอนเจอ newline)
+    lines = []
+    for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if len(lines) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(lines[0])
+        lines[0] = b"".join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            line = line.rstrip(_WHITESPACE)
+            if not line:
+                blank += 1
+                continue
+            if started:
+                for _ in range(blank):
+                    yield b""
+            started = True
+            blank = 0
+            yield line
+    line = b"".join(pending).rstrip(_WHITESPACE)
+    if line:
+        if started:
+            for _ in range(blank):
+                yield b""
+        yield line
+
+def _tokens(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    pending = []  # token ที่ถูกตัดกลางระหว่าง chunk
+    for chunk in chunks:
+        parts = chunk.split()
+        if not parts:
+            if pending:
+                yield b"".join(pending)
+                pending = []
+            continue
+        if pending:
+            if chunk[:1] in _WHITESPACE:
+                yield b"".join(pending)
+            else:
+                parts[0] = b"".join(pending) + parts[0]
+            pending = []
+        if chunk[-1:] not in _WHITESPACE:
+            pending.append(parts.pop())
+        yield from parts
+    if pending:
+        yield b"".join(pending)
+
+def _float_equal(got: bytes, want: bytes) -> bool:
+    if got == want:
+        return True
+    try:
+        a = float(got)
+        b = float(want)
+    except ValueError:
+        return False
+    return abs(a - b) <= FLOAT_TOLERANCE * max(1.0, abs(b))
+
+def _preview(token) -> str:
+    if token is None:
+        return "<end of output>"
+    text = token.decode(errors="replace")
+    return text if len(text) <= _PREVIEW else text[:_PREVIEW] + "..."
+
+def check(actual: BinaryIO, expected: BinaryIO, mode: str = DEFAULT_MODE, limit: int = OUTPUT_LIMIT_BYTES) -> Tuple[bool, str]:
+    """Compare the program output stream against the expected output stream.
+
+    Both sides are read CHUNK_SIZE bytes at a time and the comparison stops at
+    the first difference, so memory use does not depend on the output size.
+    Returns (ok, message); raises OutputLimitExceeded once more than `limit`
+    bytes of program output have been read.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown checker mode: {mode}")
+
+    if mode == "exact":
+        got_items = _lines(_chunks(actual, limit))
+        want_items = _lines(_chunks(expected))
+        unit = "line"
+    else:
+        got_items = _tokens(_chunks(actual, limit))
+        want_items = _tokens(_chunks(expected))
+        unit = "token"
+
+    equal = _float_equal if mode == "float" else bytes.__eq__
+    for index, (got, want) in enumerate(zip_longest(got_items, want_items), start=1):
+        if got is None or want is None or not equal(got, want):
+            return False, f"{unit} {index}: expected {_preview(want)}, got {_preview(got)}"
+    return True, "OK"
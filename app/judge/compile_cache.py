@@ -0,0 +1,153 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+# คำสั่งคอมไพล์ต่อภาษา (ไฟล์ source และ output จะถูกต่อท้ายตอนคอมไพล์)
+COMPILE_COMMANDS = {
+    "c": ["gcc", "-O2", "-std=c17"],
+    "cpp": ["g++", "-O2", "-std=c++17"],
+}
+SOURCE_NAMES = {"c": "main.c", "cpp": "main.cpp"}
+CACHE_SUBDIR = Path("cache") / "bin"  # relative to the data directory
+COMPILE_TIMEOUT_S = 30
+CACHE_MAX_BYTES = int(os.getenv("GRADER_COMPILE_CACHE_MB", "256")) * 1024 * 1024
+# ข้อความของ compiler ที่แปลว่าล้มเหลวเพราะเครื่อง (memory หมด, ถูก kill) ไม่ใช่เพราะ source จึงไม่ cache
+TRANSIENT_MARKERS = (
+    "Killed signal terminated program",
+    "virtual memory exhausted",
+    "out of memory",
+    "Cannot allocate memory",
+    "internal compiler error",
+)
+
+_lock = threading.Lock()
+_key_locks = {}  # key -> [lock, จำนวน thread ที่ถือหรือรอ lock นี้] ลบทิ้งเมื่อไม่มีใครใช้แล้ว
+_stats = {"hits": 0, "misses": 0}
+
+def cache_key(language: str, source: bytes) -> str:
+    """Content address of a build: language + compiler command line + source bytes."""
+    h = hashlib.sha256()
+    h.update(language.encode())
+    h.update(b"\0")
+    h.update("\0".join(COMPILE_COMMANDS[language]).encode())
+    h.update(b"\0")
+    h.update(source)
+    return h.hexdigest()
+
+@contextmanager
+def _key_lock(key: str):
+    """Hold the lock of one cache key; the lock exists only while someone holds or waits for it."""
+    with _lock:
+        entry = _key_locks.get(key)
+        if entry is None:
+            entry = _key_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+def _compile(language: str, source: bytes, out_path: Path) -> Tuple[bool, str, bool]:
+    """Returns (ok, output, deterministic); a failure is deterministic when the compiler itself rejected the source.
+
+    Timeouts, compilers killed by a signal and failures reported as
+    resource exhaustion are not: the same source may compile next time.
+    """
+    # คอมไพล์ในโฟลเดอร์ชั่วคราวด้วยชื่อไฟล์คงที่ เพื่อให้ข้อความจาก compiler เหมือนกันทุกครั้งและ cache ได้
+    with tempfile.TemporaryDirectory(dir=out_path.parent) as tmp:
+        src = Path(tmp) / SOURCE_NAMES[language]
+        src.write_bytes(source)
+        exe = Path(tmp) / "main.exe"
+        cmd = COMPILE_COMMANDS[language] + [src.name, "-o", exe.name]
+        try:
+            r = subprocess.run(cmd, cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=COMPILE_TIMEOUT_S)
+        except Exception as e:
+            # timeout หรือเรียก compiler ไม่ได้ ไม่ใช่ผลของ source นี้ จึงไม่ cache
+            return False, str(e), False
+        if r.returncode != 0:
+            transient = r.returncode < 0 or any(marker in r.stdout for marker in TRANSIENT_MARKERS)
+            return False, r.stdout, not transient
+        os.replace(exe, out_path)
+        return True, r.stdout, True
+
+def _evict(cache_dir: Path, keep: str):
+    """Drop least recently used binaries until the cache fits in CACHE_MAX_BYTES."""
+    entries = []
+    total = 0
+    for exe in list(cache_dir.glob("*.exe")) + list(cache_dir.glob("*.fail")):
+        try:
+            st = exe.stat()
+        except FileNotFoundError:
+            continue
+        total += st.st_size
+        entries.append((st.st_mtime, st.st_size, exe))
+    entries.sort()
+    for _, size, exe in entries:
+        if total <= CACHE_MAX_BYTES:
+            break
+        if exe.stem == keep:
+            continue
+        exe.unlink(missing_ok=True)
+        exe.with_suffix(".log").unlink(missing_ok=True)
+        total -= size
+
+def get_executable(cache_dir: Path, language: str, source_path: Path, exe_path: Path) -> Tuple[bool, str, bool]:
+    """Place a compiled binary for source_path at exe_path.
+
+    Returns (ok, compile_output, cache_hit). Concurrent requests for the same
+    key wait for a single compile instead of each invoking the compiler.
+    Compile errors are cached as well, so rejudging many copies of a source
+    that does not compile runs the compiler once (transient failures are not).
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    source = Path(source_path).read_bytes()
+    key = cache_key(language, source)
+    cached_exe = cache_dir / f"{key}.exe"
+    cached_log = cache_dir / f"{key}.log"
+    cached_fail = cache_dir / f"{key}.fail"
+
+    with _key_lock(key):
+        with _lock:
+            if cached_exe.exists():
+                os.utime(cached_exe)  # bump LRU position
+                shutil.copy2(cached_exe, exe_path)
+                _stats["hits"] += 1
+                return True, cached_log.read_text() if cached_log.exists() else "", True
+            if cached_fail.exists():
+                os.utime(cached_fail)
+                _stats["hits"] += 1
+                return False, cached_fail.read_text(), True
+            _stats["misses"] += 1
+
+        ok, output, deterministic = _compile(language, source, cached_exe)
+        if not ok:
+            if deterministic:
+                with _lock:
+                    cached_fail.write_text(output)
+                    _evict(cache_dir, keep=key)
+            return False, output, False
+
+        with _lock:
+            cached_log.write_text(output)
+            shutil.copy2(cached_exe, exe_path)
+            _evict(cache_dir, keep=key)
+        return True, output, False
+
+def stats(cache_dir: Optional[Path] = None) -> dict:
+    with _lock:
+        result = dict(_stats)
+        if cache_dir is not None and cache_dir.exists():
+            sizes = [p.stat().st_size for p in cache_dir.glob("*.exe")]
+            result["entries"] = len(sizes)
+            result["bytes"] = sum(sizes)
+    return result
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+# คิวงานของ judge ภายใน process: route ที่สร้าง/รีเซ็ต submission เป็น queued
+# จะ push id เข้ามา แล้ว worker จะตื่นขึ้นมาทันทีแทนการ poll ฐานข้อมูล
+#
+# งานถูกแยกเป็น class ตามลำดับความสำคัญ: submission แรกของ user ในโจทย์หนึ่ง,
+# submission ปกติ, แล้วจึงงาน rejudge จำนวนมาก ภายใน class เดียวกันจะวนทีละ user
+# (round-robin) คนที่ส่งรัว ๆ 30 อันจึงได้ตรวจทีละอันสลับกับคนอื่น ไม่ใช่ทั้ง 30 อันก่อน
+PRIORITY_FIRST = 0
+PRIORITY_LIVE = 1
+PRIORITY_REJUDGE = 2
+CLASS_NAMES = {PRIORITY_FIRST: "first", PRIORITY_LIVE: "live", PRIORITY_REJUDGE: "rejudge"}
+# จำนวน submission ของ user หนึ่งที่ตรวจพร้อมกันได้ (0 = ไม่จำกัด) ไม่นับงาน rejudge
+USER_INFLIGHT_LIMIT = int(os.getenv("GRADER_USER_INFLIGHT", "2"))
+WAIT_SAMPLES = 1000
+
+_cond = threading.Condition()
+# class -> OrderedDict(user_id -> deque ของ submission id); ลำดับของ user คือลำดับ round-robin
+_queues = {priority: OrderedDict() for priority in CLASS_NAMES}
+_queued = {}          # submission id -> priority ของ id ที่รออยู่ในคิว (id หนึ่งอยู่ในคิวได้ครั้งเดียว)
+# submission id -> list ของ (user_id, priority) ทุกครั้งที่ worker หยิบไป
+# id เดียวกันอาจถูกหยิบซ้อนกันได้ (rerun ระหว่างกำลังตรวจ) แต่ละครั้งคืน slot ของตัวเองใน done()
+_inflight = {}
+_user_inflight = {}   # user_id -> จำนวนงาน live ที่กำลังตรวจ
+_waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in CLASS_NAMES}
+
+def notify(submission_id: int, priority: int = PRIORITY_LIVE, user_id: Optional[int] = None):
+    """Tell the judge workers that a submission has been committed as queued.
+
+    Lower priority values are served first; within a class users take turns
+    and each user's submissions come out in the order they were notified.
+    An id that is already waiting is not queued twice; it only moves up if
+    the new priority is better.
+    """
+    with _cond:
+        queued = _queued.get(submission_id)
+        if queued is not None:
+            if queued <= priority:
+                return
+            _unqueue(submission_id, queued)
+        _queued[submission_id] = priority
+        _queues[priority].setdefault(user_id, deque()).append(submission_id)
+        _cond.notify()
+
+def _unqueue(submission_id: int, priority: int):
+    users = _queues[priority]
+    for user_id, pending in list(users.items()):
+        if submission_id in pending:
+            pending.remove(submission_id)
+            if not pending:
+                del users[user_id]
+            return
+
+def _limited(user_id: Optional[int], priority: int) -> bool:
+    if priority == PRIORITY_REJUDGE or user_id is None or USER_INFLIGHT_LIMIT <= 0:
+        return False
+    return _user_inflight.get(user_id, 0) >= USER_INFLIGHT_LIMIT
+
+def _pick():
+    for priority, users in _queues.items():
+        for user_id in list(users):
+            if _limited(user_id, priority):
+                continue
+            pending = users.pop(user_id)
+            submission_id = pending.popleft()
+            if pending:
+                users[user_id] = pending  # ต่อท้าย = รอรอบถัดไปหลัง user อื่น
+            del _queued[submission_id]
+            return submission_id, user_id, priority
+    return None
+
+def next_submission(timeout: Optional[float] = None) -> Optional[int]:
+    """Block until a submission may be judged; None if the timeout expires.
+
+    The caller must call done() with the id once it has finished with it
+    (claimed or not), which frees the user's in-flight slot.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _cond:
+        while True:
+            picked = _pick()
+            if picked is not None:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            _cond.wait(remaining)
+        submission_id, user_id, priority = picked
+        _inflight.setdefault(submission_id, []).append((user_id, priority))
+        if priority != PRIORITY_REJUDGE and user_id is not None:
+            _user_inflight[user_id] = _user_inflight.get(user_id, 0) + 1
+        return submission_id
+
+def done(submission_id: int):
+    """Release one pick of submission_id (each next_submission() result is released once)."""
+    with _cond:
+        picks = _inflight.get(submission_id)
+        if not picks:
+            return
+        user_id, priority = picks.pop(0)
+        if not picks:
+            del _inflight[submission_id]
+        if priority != PRIORITY_REJUDGE and user_id is not None:
+            left = _user_inflight.get(user_id, 0) - 1
+            if left > 0:
+                _user_inflight[user_id] = left
+            else:
+                _user_inflight.pop(user_id, None)
+            # user นี้อาจมีงานที่รอ slot อยู่
+            _cond.notify_all()
+
+def retry(submission_id: int):
+    """Queue a picked id again with the priority and user it was picked with.
+
+    For a worker that could not claim the row (e.g. the database was locked):
+    the id has already left the queue, so without this it would wait for the
+    next startup scan. Call before done() for the same pick.
+    """
+    with _cond:
+        picks = _inflight.get(submission_id)
+        if not picks:
+            return
+        user_id, priority = picks[-1]
+        notify(submission_id, priority, user_id)
+
+def record_wait(submission_id: int, wait_ms: int):
+    """Remember how long a claimed submission waited in the queue, per class."""
+    with _cond:
+        picks = _inflight.get(submission_id)
+        if picks:
+            _waits[picks[-1][1]].append(wait_ms)
+
+def pending_count() -> int:
+    with _cond:
+        return sum(len(pending) for users in _queues.values() for pending in users.values())
+
+def pending_by_priority() -> dict:
+    with _cond:
+        return {CLASS_NAMES[p]: sum(len(q) for q in users.values()) for p, users in _queues.items()}
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+def stats() -> dict:
+    """Queue depth, waiting users and recent queue-wait percentiles per class (for the admin status endpoint)."""
+    with _cond:
+        result = {}
+        for priority, users in _queues.items():
+            waits = list(_waits[priority])
+            result[CLASS_NAMES[priority]] = {
+                "queued": sum(len(q) for q in users.values()),
+                "users_waiting": len(users),
+                "wait_ms_p50": _percentile(waits, 0.5),
+                "wait_ms_p95": _percentile(waits, 0.95),
+                "wait_ms_max": max(waits) if waits else None,
+            }
+        result["inflight_by_user"] = dict(_user_inflight)
+        result["user_inflight_limit"] = USER_INFLIGHT_LIMIT
+        return result
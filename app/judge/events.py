@@ -0,0 +1,84 @@
+import asyncio
+import json
+import threading
+from typing import Optional, Set
+
+from app import scoreboard
+
+# จำนวน event ที่ค้างได้ต่อ client ก่อนจะเริ่มทิ้ง (client ที่อ่านช้าไม่ทำให้ judge ช้าตาม)
+QUEUE_SIZE = 1000
+# ส่ง comment ว่าง ๆ เป็นระยะ เพื่อไม่ให้ proxy ตัด connection ที่เงียบ
+HEARTBEAT_S = 15
+
+_lock = threading.Lock()
+_subscribers = set()
+
+class Subscription:
+    """One SSE client: an asyncio queue bound to the loop that serves it."""
+
+    def __init__(self, submission_ids: Set[int], user_id: Optional[int], is_admin: bool):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.submission_ids = submission_ids
+        self.user_id = user_id
+        self.is_admin = is_admin
+
+    def wants(self, event: dict) -> bool:
+        if event["submission_id"] not in self.submission_ids:
+            return False
+        # ผลรายเทสต์เห็นได้เฉพาะเจ้าของและ admin (เหมือนหน้า submission detail)
+        if self.is_admin or event.get("user_id") == self.user_id:
+            return True
+        # คนอื่นไม่ได้ผลรายเทสต์ และระหว่าง freeze scoreboard ผลของคนอื่นไม่ถูกส่งเลย
+        return event["type"] != "test" and scoreboard.frozen_at() is None
+
+    def view(self, event: dict) -> dict:
+        # detail ของเทสต์ที่ไม่ผ่านมีส่วนต้นของ expected output เห็นได้เฉพาะ admin
+        if event["type"] == "test" and not self.is_admin and "detail" in event:
+            return {k: v for k, v in event.items() if k != "detail"}
+        return event
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def next_event(self) -> Optional[dict]:
+        """Next event, or None after HEARTBEAT_S of silence."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=HEARTBEAT_S)
+        except asyncio.TimeoutError:
+            return None
+
+def subscribe(submission_ids: Set[int], user_id: Optional[int] = None, is_admin: bool = False) -> Subscription:
+    """Register a client; must be called from the event loop that will read it."""
+    sub = Subscription(submission_ids, user_id, is_admin)
+    with _lock:
+        _subscribers.add(sub)
+    return sub
+
+def unsubscribe(sub: Subscription):
+    with _lock:
+        _subscribers.discard(sub)
+
+def publish(event: dict):
+    """Send an event to every interested client. Safe to call from judge threads.
+
+    event must have "type" (status | test) and "submission_id".
+    """
+    with _lock:
+        targets = [sub for sub in _subscribers if sub.wants(event)]
+    for sub in targets:
+        try:
+            sub.loop.call_soon_threadsafe(sub._put, sub.view(event))
+        except RuntimeError:
+            # loop ปิดไปแล้ว (server กำลัง shutdown)
+            unsubscribe(sub)
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def subscriber_count() -> int:
+    with _lock:
+        return len(_subscribers)
@@ -0,0 +1,384 @@
+import io
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: ไม่มี rlimit
+    resource = None
+
+SANDBOX_SUBDIR = Path("sandbox")  # relative to the data directory
+PROGRAM_NAME = "prog"
+# RLIMIT_AS = ADDRESS_SPACE_FACTOR เท่าของ memory limit + MEMORY_HEADROOM_BYTES (library, stack, runtime ของ C/C++)
+# เผื่อไว้มากเพราะ memory limit จริงวัดจาก peak RSS ใน _watch: ถ้าชน rlimit นี้ก่อน malloc/new จะล้มเหลว
+# แล้วโปรแกรมตายเป็น runtime error แทนที่จะได้ memory limit
+ADDRESS_SPACE_FACTOR = 2
+MEMORY_HEADROOM_BYTES = 64 * 1024 * 1024
+# rlimit อื่น ๆ ของโปรแกรมที่ส่งมา
+MAX_PROCESSES = int(os.getenv("GRADER_SANDBOX_NPROC", "64"))
+MAX_FILE_BYTES = int(os.getenv("GRADER_SANDBOX_FSIZE_MB", "16")) * 1024 * 1024
+MAX_OPEN_FILES = int(os.getenv("GRADER_SANDBOX_NOFILE", "64"))
+# stderr เก็บไว้แค่ช่วงต้นเพื่อใช้แสดงใน runtime error ที่เหลือทิ้ง
+STDERR_LIMIT_BYTES = 4 * 1024
+# ความถี่ในการตรวจ wall time / memory ของโปรแกรมที่กำลังรัน
+WATCH_INTERVAL_S = 0.01
+KILLED_BY_JUDGE = -getattr(signal, "SIGKILL", 9)
+# หลังโปรแกรมจบแล้ว อ่านข้อมูลที่ค้างใน pipe ต่อได้อีกไม่เกินเท่านี้ (กันโปรแกรมที่ fork ไว้เขียนไม่หยุด)
+STOP_GRACE_S = 0.1
+PIPE_CHUNK = 64 * 1024
+# select() ใช้กับ pipe ได้เฉพาะบน POSIX
+_SELECT_PIPES = os.name == "posix"
+
+def _setrlimit(which: int, value: int):
+    _, hard = resource.getrlimit(which)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(which, (value, value if hard == resource.RLIM_INFINITY else hard))
+
+def _limit_resources(limits: dict):
+    """preexec_fn: rlimits for the submitted program (POSIX only)."""
+    cpu_s = int(limits["time_limit_ms"] / 1000) + 1
+    _setrlimit(resource.RLIMIT_CPU, cpu_s)
+    # memory limit จริงตรวจจาก peak RSS ใน _watch, rlimit นี้เป็นแค่กันหลุด
+    _setrlimit(resource.RLIMIT_AS, limits["memory_limit_kb"] * 1024 * ADDRESS_SPACE_FACTOR + MEMORY_HEADROOM_BYTES)
+    # ให้ stack ใช้ได้เต็ม memory limit (recursion ลึก ๆ ไม่ต้องตายที่ 8 MB)
+    _setrlimit(resource.RLIMIT_STACK, limits["memory_limit_kb"] * 1024)
+    _setrlimit(resource.RLIMIT_FSIZE, MAX_FILE_BYTES)
+    _setrlimit(resource.RLIMIT_NOFILE, MAX_OPEN_FILES)
+    if hasattr(resource, "RLIMIT_NPROC"):
+        _setrlimit(resource.RLIMIT_NPROC, MAX_PROCESSES)
+    _setrlimit(resource.RLIMIT_CORE, 0)
+
+def kill(process: subprocess.Popen):
+    """Kill the program and everything it forked.
+
+    Never use process.kill()/poll() before wait(): they reap the child and its
+    rusage is lost.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+class _PipeReader(io.RawIOBase):
+    """Read end of one of the program's output pipes that does not wait for EOF forever.
+
+    Once stop is set (the program itself has exited) reads return whatever
+    is still waiting and then EOF, even if some process the program forked
+    into a new session (out of reach of killpg) still holds the pipe open.
+    eof tells whether a real EOF was seen, i.e. no writer is left.
+    """
+
+    def __init__(self, pipe: BinaryIO, stop: threading.Event):
+        super().__init__()
+        self.pipe = pipe
+        self.stop = stop
+        self.eof = False
+        self._stopped_at = None
+
+    def readable(self) -> bool:
+        return True
+
+    def fileno(self) -> int:
+        return self.pipe.fileno()
+
+    def readinto(self, buffer) -> int:
+        fd = self.pipe.fileno()
+        while True:
+            if self.stop.is_set() and self._stopped_at is None:
+                self._stopped_at = time.monotonic()
+            stopping = self._stopped_at is not None
+            if stopping and time.monotonic() - self._stopped_at > STOP_GRACE_S:
+                return 0
+            ready, _, _ = select.select([fd], [], [], 0 if stopping else WATCH_INTERVAL_S)
+            if ready:
+                data = os.read(fd, len(buffer))
+                if not data:
+                    self.eof = True
+                buffer[:len(data)] = data
+                return len(data)
+            if stopping:
+                return 0
+
+def _feed_stdin(stdin, data: bytes, stop: threading.Event):
+    try:
+        if not _SELECT_PIPES:
+            stdin.write(data)
+            return
+        # เขียนแบบ non-blocking: ถ้าโปรแกรมไม่อ่าน input แต่มีตัวอื่นถือ pipe ไว้ จะไม่ค้างที่นี่
+        fd = stdin.fileno()
+        os.set_blocking(fd, False)
+        view = memoryview(data)
+        while view and not stop.is_set():
+            try:
+                view = view[os.write(fd, view[:PIPE_CHUNK]):]
+            except BlockingIOError:
+                select.select([], [fd], [], WATCH_INTERVAL_S)
+    except (BrokenPipeError, OSError):
+        # โปรแกรมจบหรือปิด stdin ก่อนอ่าน input หมด ไม่ถือเป็น error ของ judge
+        pass
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+def _drain_stderr(stderr, sink: bytearray):
+    """Keep the first STDERR_LIMIT_BYTES of stderr and discard the rest so the pipe never blocks."""
+    try:
+        for chunk in iter(lambda: stderr.read(4096), b""):
+            if len(sink) < STDERR_LIMIT_BYTES:
+                sink.extend(chunk[:STDERR_LIMIT_BYTES - len(sink)])
+    except (OSError, ValueError):
+        pass
+
+def _read_peak_kb(pid: int, name: str) -> Optional[int]:
+    """VmHWM of a running process from /proc (Linux), or None.
+
+    VmHWM is reset by exec, so unlike ru_maxrss it never includes the memory
+    of the judge process the child was forked from. Samples taken before the
+    exec (when the name still differs) are ignored.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            status = f.read()
+    except OSError:
+        return None
+    fields = dict(line.split(":", 1) for line in status.splitlines() if ":" in line)
+    if fields.get("Name", "").strip() != name or "VmHWM" not in fields:
+        return None
+    return int(fields["VmHWM"].split()[0])
+
+def _watch(process: subprocess.Popen, limits: dict, done: threading.Event, usage: dict):
+    """Enforce the wall-clock and memory limits and sample peak memory until the run finishes."""
+    deadline = time.monotonic() + limits["wall_limit_s"]
+    name = Path(process.args[0]).name[:15]
+    # ตรวจถี่ ๆ ช่วงแรกเพื่อให้โปรแกรมที่จบเร็วยังวัด memory ได้ แล้วค่อยห่างออกจนถึง WATCH_INTERVAL_S
+    interval = 0.001
+    while not done.wait(interval):
+        interval = min(interval * 2, WATCH_INTERVAL_S)
+        peak_kb = _read_peak_kb(process.pid, name)
+        if peak_kb:
+            usage["memory_kb"] = max(usage["memory_kb"], peak_kb)
+        if usage["memory_kb"] > limits["memory_limit_kb"]:
+            usage["killed_for"] = "memory_limit"
+            kill(process)
+            return
+        if time.monotonic() >= deadline:
+            usage["killed_for"] = "time_limit"
+            kill(process)
+            return
+
+def _reap(process: subprocess.Popen, baseline_kb: int, stop: threading.Event, result: list):
+    """Wait for the program itself to exit (not for EOF on its pipes), kill its process group, reap it and set stop."""
+    try:
+        if hasattr(os, "waitid") and hasattr(os, "WNOWAIT"):
+            try:
+                os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            except ChildProcessError:
+                pass
+            # ยังไม่ reap: process group ยังเป็นของโปรแกรมนี้แน่นอน ฆ่า process ลูกที่ fork ทิ้งไว้ได้ปลอดภัย
+            kill(process)
+        result.extend(_wait(process, baseline_kb))
+    finally:
+        stop.set()
+
+def _pipe_ids(*pipes) -> set:
+    ids = set()
+    for pipe in pipes:
+        try:
+            ids.add(f"pipe:[{os.fstat(pipe.fileno()).st_ino}]")
+        except (OSError, ValueError):
+            pass
+    return ids
+
+def _parent_and_session(pid: str) -> Tuple[int, int]:
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read()
+    # ชื่อ process อยู่ในวงเล็บและอาจมีช่องว่าง ฟิลด์ที่เหลืออยู่หลัง ")" ตัวสุดท้าย
+    fields = stat[stat.rindex(")") + 2:].split()
+    return int(fields[1]), int(fields[3])
+
+def _kill_pipe_holders(pipe_ids: set, rounds: int = 3):
+    """SIGKILL processes the program left behind that still hold one of its pipes (Linux /proc).
+
+    These are descendants that moved to a new session, so killpg() did not
+    reach them, and were reparented away from the judge when the program
+    exited. Children of the judge itself are never touched: between fork
+    and exec, the processes other workers and test slots are starting
+    still hold every fd the judge has open, including these pipes.
+    Processes that also closed their pipes cannot be found this way.
+    """
+    me = os.getpid()
+    my_session = os.getsid(0)
+    for _ in range(rounds):
+        found = False
+        try:
+            entries = [e.name for e in os.scandir("/proc") if e.name.isdigit() and int(e.name) != me]
+        except OSError:
+            return
+        for pid in entries:
+            try:
+                fds = os.listdir(f"/proc/{pid}/fd")
+                if not any(os.readlink(f"/proc/{pid}/fd/{fd}") in pipe_ids for fd in fds):
+                    continue
+                parent, session = _parent_and_session(pid)
+                if parent == me or session == my_session:
+                    continue
+                os.kill(int(pid), signal.SIGKILL)
+                found = True
+            except (OSError, ValueError):
+                continue
+        if not found:
+            return
+
+def _self_peak_kb() -> int:
+    if not resource:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def _wait(process: subprocess.Popen, baseline_kb: int) -> Tuple[int, float, int]:
+    """Reap the child and return (returncode, cpu_ms, peak_memory_kb) from its rusage.
+
+    ru_maxrss also counts the judge process the child was forked from, so it
+    is only trusted when it is above that baseline; otherwise peak memory is
+    0 (unknown) and only the /proc samples from _watch count.
+    """
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return process.returncode, 0.0, 0
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return process.returncode, 0.0, 0
+    process.returncode = os.waitstatus_to_exitcode(status)
+    cpu_ms = (usage.ru_utime + usage.ru_stime) * 1000
+    # ru_maxrss เป็น KB บน Linux แต่เป็น byte บน macOS
+    peak_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return process.returncode, cpu_ms, peak_kb if peak_kb > baseline_kb else 0
+
+class Sandbox:
+    """A scratch directory owned by one judge slot.
+
+    prepare() copies a submission's binary in once; the directory is then
+    reused for every test of that submission and wiped of anything the
+    program wrote between tests.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.program = root / PROGRAM_NAME
+
+    def prepare(self, exe_path: Path):
+        if self.root.exists():
+            shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(exe_path, self.program)
+
+    def clean(self):
+        for entry in self.root.iterdir():
+            if entry == self.program:
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+    def run(self, stdin_data: bytes, limits: dict, consume: Callable[[BinaryIO], Tuple[bool, str]], on_start=None) -> dict:
+        """Run the prepared program once.
+
+        consume() reads the program's stdout while it runs and returns
+        (ok, message); when it reports a failure the program is killed
+        straight away. The run ends when the program itself exits or is
+        killed, not when its pipes reach EOF, and processes it forked out
+        of its process group that still hold a pipe are killed afterwards. limits holds time_limit_ms, wall_limit_s and
+        memory_limit_kb. The returned dict has returncode, time_ms (CPU),
+        wall_ms, memory_kb (peak RSS, None if it could not be measured), killed_for (time_limit |
+        memory_limit | None), killed_by_judge, ok, message, error and stderr.
+        """
+        run = {"returncode": None, "time_ms": 0, "wall_ms": 0, "memory_kb": 0, "killed_for": None,
+               "killed_by_judge": False, "ok": False, "message": "", "error": None, "stderr": ""}
+        baseline_kb = _self_peak_kb()
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                [str(self.program)],
+                cwd=self.root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                preexec_fn=(lambda: _limit_resources(limits)) if resource else None,
+                start_new_session=True,
+            )
+        except Exception as e:
+            run["error"] = str(e)
+            return run
+        if on_start:
+            on_start(process)
+
+        usage = {"memory_kb": 0, "killed_for": None}
+        stderr = bytearray()
+        done = threading.Event()
+        # stop ถูก set เมื่อตัวโปรแกรมจบ (รวมถึงถูกฆ่าเพราะเกินเวลา/memory) ไม่ต้องรอ EOF ของ pipe
+        stop = threading.Event()
+        exited = []
+        pipe_ids = _pipe_ids(process.stdout, process.stderr) if _SELECT_PIPES else set()
+        stdout = _PipeReader(process.stdout, stop) if _SELECT_PIPES else process.stdout
+        stderr_pipe = _PipeReader(process.stderr, stop) if _SELECT_PIPES else process.stderr
+        reaper = threading.Thread(target=_reap, args=(process, baseline_kb, stop, exited), daemon=True)
+        helpers = [
+            threading.Thread(target=_watch, args=(process, limits, done, usage), daemon=True),
+            threading.Thread(target=_feed_stdin, args=(process.stdin, stdin_data, stop), daemon=True),
+            threading.Thread(target=_drain_stderr, args=(stderr_pipe, stderr), daemon=True),
+        ]
+        # watcher เริ่มก่อน: โปรแกรมที่จบเร็วมากยังวัด memory ทันก่อนถูก reap
+        for t in helpers + [reaper]:
+            t.start()
+
+        try:
+            run["ok"], run["message"] = consume(stdout)
+        except Exception as e:
+            run["error"] = str(e)
+        finally:
+            if not run["ok"]:
+                # คำตอบผิดแล้ว ไม่ต้องรอให้โปรแกรมรันจนจบ
+                kill(process)
+                run["killed_by_judge"] = True
+            reaper.join()
+            returncode, cpu_ms, rusage_kb = exited
+            done.set()
+            for t in helpers:
+                t.join()
+            if _SELECT_PIPES:
+                # อ่านส่วนที่เหลือทิ้ง: ถ้ายังไม่เจอ EOF แปลว่ามี process อื่นถือ pipe ไว้อยู่
+                while stdout.read(PIPE_CHUNK):
+                    pass
+                if not (stdout.eof and stderr_pipe.eof):
+                    _kill_pipe_holders(pipe_ids)
+            process.stdout.close()
+            process.stderr.close()
+            self.clean()
+
+        run["returncode"] = returncode
+        run["time_ms"] = int(cpu_ms)
+        run["wall_ms"] = int((time.monotonic() - started) * 1000)
+        # โปรแกรมที่จบเร็วกว่าการ sample ครั้งแรกและใช้ memory น้อยกว่า judge วัดไม่ได้ ไม่ใช่ 0 KB
+        run["memory_kb"] = max(usage["memory_kb"], rusage_kb) or None
+        run["killed_for"] = usage["killed_for"]
+        run["stderr"] = stderr.decode(errors="replace")
+        return run
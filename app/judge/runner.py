@@ -1,38 +1,136 @@
 import threading
+import queue
+import json
 import time
-import subprocess
-import shutil
+import os
+import signal
+from datetime import datetime
 from pathlib import Path
-from typing import Tuple
-from sqlmodel import Session, select, func
+from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import case, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, func, update
 from app.db import engine
-from app.models import Submission, Problem, User
+from app import cache, scoreboard
+from app.models import Submission, Problem, User, BestScore, UserStats
+from app.judge import dispatch, compile_cache, testcases, checker, executor, events
+
+# จำนวน judge worker (ค่าเริ่มต้น = จำนวน core)
+JUDGE_WORKERS = int(os.getenv("GRADER_JUDGE_WORKERS", "0")) or (os.cpu_count() or 1)
+# จำนวน testcase ที่รันพร้อมกันต่อหนึ่ง submission (1 = รันทีละเทสต์)
+TEST_PARALLELISM = max(1, int(os.getenv("GRADER_TEST_PARALLELISM", "1")))
+FATAL_VERDICTS = ("time_limit", "memory_limit", "runtime_error")
+# stderr ของโปรแกรมที่ตายเพราะจอง memory ไม่ได้ (ชน RLIMIT_AS ก่อน memory limit ที่วัดจาก RSS)
+ALLOCATION_FAILURE_MARKERS = ("std::bad_alloc",)
 
 _runner_started = False
+_workers = []
+_workers_lock = threading.Lock()
 
-def start_runner(base_data_dir: Path):
+def start_runner(base_data_dir: Path, workers: Optional[int] = None):
     global _runner_started
     if _runner_started:
         return
     _runner_started = True
 
-    t = threading.Thread(target=_loop, args=(base_data_dir,), daemon=True)
-    t.start()
+    _recover_pending()
+    for i in range(workers or JUDGE_WORKERS):
+        state = {
+            "worker": i,
+            "state": "idle",
+            "submission_id": None,
+            "since": datetime.utcnow().isoformat(),
+            "judged": 0,
+            "last_error": None,
+        }
+        _workers.append(state)
+        t = threading.Thread(target=_loop, args=(base_data_dir, state), name=f"judge-{i}", daemon=True)
+        t.start()
+
+def get_worker_states():
+    """Snapshot of every judge worker's state (for the admin status endpoint)."""
+    with _workers_lock:
+        return [dict(state) for state in _workers]
+
+def _set_worker_state(worker: dict, **changes):
+    with _workers_lock:
+        worker.update(changes)
+
+def _recover_pending():
+    """Startup/crash-recovery scan: requeue rows left in running and enqueue every queued row.
+
+    This is the only place the judge scans the submission table; afterwards
+    workers are woken by dispatch.notify().
+    """
+    with Session(engine) as session:
+        session.execute(
+            update(Submission)
+            .where(Submission.status == "running")
+            .values(status="queued", updated_at=datetime.utcnow())
+        )
+        session.commit()
+        pending = session.exec(
+            select(Submission.id, Submission.user_id, Submission.rejudge_batch_id)
+            .where(Submission.status == "queued").order_by(Submission.id.asc())
+        ).all()
+    # งาน rejudge ที่ค้างอยู่ยังคงอยู่ใน class priority ต่ำเหมือนก่อน restart
+    for sub_id, user_id, batch_id in pending:
+        dispatch.notify(sub_id, dispatch.PRIORITY_LIVE if batch_id is None else dispatch.PRIORITY_REJUDGE, user_id)
+    if pending:
+        print(f"Judge: recovered {len(pending)} queued submission(s)")
+
+def _claim(session: Session, sub_id: int) -> Optional[Submission]:
+    """Move a queued submission to running and return it, or None if it is no longer queued.
+
+    The UPDATE is conditional on the row still being queued, so when the same
+    id is delivered twice (or two workers race for it) only one claim wins.
+    The claim timestamp is written to updated_at and doubles as a claim token.
+    Until then updated_at is the time the row was (re)queued, so the same
+    statement records how long it waited in queue_wait_ms.
+    """
+    now = datetime.utcnow()
+    waited_ms = cast((func.julianday(now.isoformat(sep=" ")) - func.julianday(Submission.updated_at)) * 86400000, Integer)
+    result = session.execute(
+        update(Submission)
+        .where(Submission.id == sub_id, Submission.status == "queued")
+        .values(status="running", updated_at=now, queue_wait_ms=waited_ms)
+    )
+    session.commit()
+    if result.rowcount != 1:
+        return None
+    sub = session.get(Submission, sub_id)
+    dispatch.record_wait(sub_id, sub.queue_wait_ms or 0)
+    return sub
 
-def _loop(base_data_dir: Path):
+def _loop(base_data_dir: Path, state: dict):
     while True:
+        sub_id = None
+        next_id = None
         try:
+            next_id = dispatch.next_submission()
             with Session(engine) as session:
-                sub = session.exec(select(Submission).where(Submission.status == "queued").order_by(Submission.id.asc())).first()
+                sub = _claim(session, next_id)
                 if not sub:
-                    time.sleep(0.5)
                     continue
-                
-                sub.status = "running"
-                session.add(sub)
-                session.commit()
 
-                ok, status, compile_out, run_out, exec_ms, memory_kb, passed_tests, total_tests = _judge_submission(session, sub, base_data_dir)
+                sub_id = sub.id
+                claimed_at = sub.updated_at
+                _set_worker_state(state, state="running", submission_id=sub_id, since=datetime.utcnow().isoformat())
+                events.publish({"type": "status", "submission_id": sub_id, "user_id": sub.user_id, "status": "running"})
+
+                # ชุด testcase ที่ rerun ระบุไว้ หรือชุดปัจจุบันของโจทย์ ณ ตอนเริ่มตรวจ
+                # (อัปโหลดชุดใหม่ระหว่างตรวจไม่กระทบ เพราะแต่ละชุดไม่ถูกแก้ไขหลังสร้าง)
+                version = sub.testcase_version
+                if version is None:
+                    version = testcases.current_version(base_data_dir / "problems" / str(sub.problem_id))
+
+                ok, status, compile_out, run_out, exec_ms, memory_kb, passed_tests, total_tests, test_results = _judge_submission(session, sub, base_data_dir, version, state["worker"])
+
+                # ถ้าระหว่าง judge มีการสั่ง rerun (ถูก queued ใหม่หรือถูก worker อื่น claim ไปแล้ว) ให้ทิ้งผลนี้ไป
+                session.refresh(sub)
+                if sub.status != "running" or sub.updated_at != claimed_at:
+                    continue
                 
                 # คำนวณคะแนน (ไม่มี penalty)
                 if status == "accepted":
@@ -50,111 +148,301 @@ def _loop(base_data_dir: Path):
                 sub.run_output = run_out
                 sub.exec_time_ms = exec_ms
                 sub.memory_used_kb = memory_kb
+                sub.test_results = json.dumps(test_results)
+                sub.testcase_version = version
+                sub.updated_at = datetime.utcnow()
                 session.add(sub)
+                # flush การอัปเดต submission ก่อน เพื่อให้ transaction นี้ถือ write lock ก่อนอ่านค่าเดิมของ bestscore
+                session.flush()
+                delta = _update_best_score(session, sub.user_id, sub.problem_id)
+                _update_user_stats(session, sub.user_id, delta, sub.updated_at)
                 session.commit()
-                
-                # อัปเดต user stats
-                if status == "accepted":
-                    user = session.get(User, sub.user_id)
-                    if user:
-                        user.total_score = session.exec(
-                            select(func.sum(Submission.score))
-                            .where(Submission.user_id == sub.user_id, Submission.status == "accepted")
-                        ).first() or 0
-                        user.problems_solved = session.exec(
-                            select(func.count(func.distinct(Submission.problem_id)))
-                            .where(Submission.user_id == sub.user_id, Submission.status == "accepted")
-                        ).first() or 0
-                        session.add(user)
-                        session.commit()
+                # ย้ายแถวของ user นี้ใน scoreboard ก่อน แล้ว leaderboard และตารางโจทย์ของเจ้าของ submission ค่อย render ใหม่
+                scoreboard.refresh_user(sub.user_id)
+                cache.bump("verdicts", ("verdicts", sub.user_id))
+                events.publish({
+                    "type": "status", "submission_id": sub_id, "user_id": sub.user_id, "status": status,
+                    "score": sub.score, "max_score": sub.max_score, "passed_tests": passed_tests,
+                    "total_tests": total_tests, "exec_time_ms": exec_ms, "memory_kb": memory_kb,
+                })
                         
         except Exception as e:
-            print(f"Judge error: {e}")
+            print(f"Judge error ({state['worker']}): {e}")
+            _set_worker_state(state, last_error=str(e))
+            if sub_id is not None:
+                _fail_submission(sub_id, str(e))
+            elif next_id is not None:
+                # claim ล้มเหลว (เช่น database locked): แถวยัง queued อยู่แต่ id ออกจากคิวไปแล้ว ใส่กลับคืน
+                dispatch.retry(next_id)
             time.sleep(1)
+        finally:
+            if next_id is not None:
+                # คืน slot ของ user ให้ scheduler (ทั้งกรณีตรวจเสร็จและ claim ไม่ได้)
+                dispatch.done(next_id)
+            if sub_id is not None:
+                _set_worker_state(state, state="idle", submission_id=None,
+                                  since=datetime.utcnow().isoformat(), judged=state["judged"] + 1)
+
+def _solved(best_score: int, max_score: int) -> bool:
+    return max_score > 0 and best_score >= max_score
+
+def _best_score_query(user_id: int, problem_id: int):
+    """(best score, max score, attempts, improved_at) of one (user, problem) pair; also timed by scripts/bench_queries.py."""
+    pair = (Submission.user_id == user_id, Submission.problem_id == problem_id)
+    judged = Submission.status.not_in(("queued", "running"))
+    best_score = select(func.max(Submission.score)).where(*pair).scalar_subquery()
+    # เวลาส่งของ submission แรกที่ได้คะแนนสูงสุด ใช้ตัดสินอันดับเมื่อคะแนนเท่ากัน
+    # (ไม่ใช่เวลาที่ผลตรวจเสร็จ ซึ่งขึ้นกับว่ารอคิวนานแค่ไหน)
+    return select(
+        func.max(Submission.score), func.max(Submission.max_score),
+        func.count(case((judged, Submission.id))),
+        func.min(case((Submission.score == best_score, Submission.created_at))),
+    ).where(*pair)
+
+def _update_best_score(session: Session, user_id: int, problem_id: int) -> dict:
+    """Refresh the leaderboard cell of (user, problem) from that pair's submissions.
+
+    Recomputed rather than max()-ed in, so a rerun that lowers a score is
+    reflected too; the scan only touches this pair's rows through the
+    (user_id, problem_id) index. Submissions waiting to be rejudged still
+    carry their previous score and count until the new verdict lands, so
+    the cell does not drop while a batch runs. Returns how the cell changed
+    (score, solved, submissions) for _update_user_stats.
+    """
+    old = session.exec(
+        select(BestScore).where(BestScore.user_id == user_id, BestScore.problem_id == problem_id)
+    ).first()
+    old_best, old_solved, old_attempts = (old.best_score, _solved(old.best_score, old.max_score), old.attempts) if old else (0, False, 0)
+    best, max_score, attempts, improved_at = session.exec(_best_score_query(user_id, problem_id)).one()
+    stmt = sqlite_insert(BestScore).values(
+        user_id=user_id, problem_id=problem_id, best_score=best or 0,
+        max_score=max_score or 0, attempts=attempts, improved_at=improved_at or datetime.utcnow(),
+    )
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[BestScore.user_id, BestScore.problem_id],
+        set_={
+            "best_score": stmt.excluded.best_score,
+            "max_score": stmt.excluded.max_score,
+            "attempts": stmt.excluded.attempts,
+            "improved_at": stmt.excluded.improved_at,
+        },
+    ))
+    return {
+        "score": (best or 0) - old_best,
+        "solved": int(_solved(best or 0, max_score or 0)) - int(old_solved),
+        "submissions": attempts - old_attempts,
+    }
 
-def _judge_submission(session: Session, sub: Submission, base_data_dir: Path) -> Tuple[bool, str, str, str, int, int, int, int]:
+def _update_user_stats(session: Session, user_id: int, delta: dict, activity: datetime):
+    """Apply a bestscore change to userstats with one upsert (O(1) per verdict)."""
+    stmt = sqlite_insert(UserStats).values(
+        user_id=user_id,
+        user_name=select(User.username).where(User.id == user_id).scalar_subquery(),
+        total_score=delta["score"],
+        total_submissions=delta["submissions"],
+        problems_solved=delta["solved"],
+        last_activity=activity,
+    )
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            "total_score": UserStats.total_score + delta["score"],
+            "total_submissions": UserStats.total_submissions + delta["submissions"],
+            "problems_solved": UserStats.problems_solved + delta["solved"],
+            "last_activity": stmt.excluded.last_activity,
+        },
+    ))
+
+def _fail_submission(sub_id: int, message: str):
+    """Don't leave a claimed submission stuck in running when the judge itself crashes."""
+    try:
+        with Session(engine) as session:
+            result = session.execute(
+                update(Submission)
+                .where(Submission.id == sub_id, Submission.status == "running")
+                .values(status="internal_error", run_output=message, updated_at=datetime.utcnow())
+            )
+            session.commit()
+            user_id = session.exec(select(Submission.user_id).where(Submission.id == sub_id)).first()
+        if result.rowcount == 1:
+            events.publish({"type": "status", "submission_id": sub_id, "user_id": user_id, "status": "internal_error"})
+    except Exception as e:
+        print(f"Judge error while failing submission {sub_id}: {e}")
+
+def _judge_submission(session: Session, sub: Submission, base_data_dir: Path, version: int, worker: int = 0) -> Tuple[bool, str, str, str, int, int, int, int, List[dict]]:
     prob = session.get(Problem, sub.problem_id)
     if not prob:
-        return False, "internal_error", "", "problem not found", 0, 0, 0, 0
+        return False, "internal_error", "", "problem not found", 0, 0, 0, 0, []
 
-    prob_dir = base_data_dir / "problems" / str(prob.id)
-    inputs = sorted([p for p in prob_dir.rglob("input*.txt")])
-    outputs = sorted([p for p in prob_dir.rglob("output*.txt")])
+    prob_dir = testcases.version_dir(base_data_dir / "problems" / str(prob.id), version)
+    if not prob_dir.is_dir():
+        return False, "internal_error", "", f"testcase version {version} not found", 0, 0, 0, 0, []
+    tests, unmatched = testcases.get_testcases(prob_dir)
     
-    if not inputs or len(inputs) != len(outputs):
-        return False, "internal_error", "", "testcases missing or unmatched", 0, 0, 0, 0
-
-    if sub.language == "c":
-        exe_path = Path(sub.source_path).with_suffix(".exe")
-        cmd_compile = ["gcc", "-O2", "-std=c17", sub.source_path, "-o", str(exe_path)]
-        exec_cmd = [str(exe_path)]
-    elif sub.language == "cpp":
-        exe_path = Path(sub.source_path).with_suffix(".exe")
-        cmd_compile = ["g++", "-O2", "-std=c++17", sub.source_path, "-o", str(exe_path)]
-        exec_cmd = [str(exe_path)]
-    else:
-        return False, "compile_error", "", f"Unsupported language: {sub.language}. Only C and C++ are supported.", 0, 0, 0, 0
+    if not tests or unmatched:
+        return False, "internal_error", "", "testcases missing or unmatched", 0, 0, 0, 0, []
 
-    compile_out = ""
-    if cmd_compile:
-        try:
-            r = subprocess.run(cmd_compile, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=30)
-            compile_out = r.stdout
-            if r.returncode != 0:
-                return False, "compile_error", compile_out, "", 0, 0, 0, 0
-        except Exception as e:
-            return False, "compile_error", str(e), "", 0, 0, 0, 0
+    if sub.language not in compile_cache.COMPILE_COMMANDS:
+        return False, "compile_error", "", f"Unsupported language: {sub.language}. Only C and C++ are supported.", 0, 0, 0, 0, []
+
+    exe_path = Path(sub.source_path).with_suffix(".exe")
+    try:
+        ok, compile_out, _ = compile_cache.get_executable(
+            base_data_dir / compile_cache.CACHE_SUBDIR, sub.language, Path(sub.source_path), exe_path
+        )
+    except Exception as e:
+        return False, "compile_error", str(e), "", 0, 0, 0, 0, []
+    if not ok:
+        return False, "compile_error", compile_out, "", 0, 0, 0, 0, []
 
     passed_tests = 0
-    total_tests = len(inputs)
-    total_ms = 0
-    max_memory_kb = 0
-    
-    for inp, outp in zip(inputs, outputs):
-        with inp.open("rb") as f_in:
-            try:
-                import psutil
-                import os
-                
-                # เริ่มต้น process และวัด memory
-                process = subprocess.Popen(
-                    exec_cmd,
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                
-                # ส่ง input และรอผลลัพธ์
-                stdout, _ = process.communicate(
-                    input=f_in.read(),
-                    timeout=max(1, prob.time_limit_ms / 1000.0)
-                )
-                
-                # วัด memory usage
-                try:
-                    memory_info = process.memory_info()
-                    memory_kb = memory_info.rss // 1024  # แปลงเป็น KB
-                    max_memory_kb = max(max_memory_kb, memory_kb)
-                except:
-                    max_memory_kb = max(max_memory_kb, 0)
-                
-                r = type('Result', (), {
-                    'stdout': stdout,
-                    'returncode': process.returncode
-                })()
-                
-            except subprocess.TimeoutExpired:
-                return False, "time_limit", compile_out, "time limit exceeded", total_ms, max_memory_kb, passed_tests, total_tests
-            except Exception as e:
-                return False, "runtime_error", compile_out, str(e), total_ms, max_memory_kb, passed_tests, total_tests
-        
-        output = r.stdout.decode() if isinstance(r.stdout, (bytes, bytearray)) else r.stdout
-        expected = outp.read_text()
-        
-        if output.strip() == expected.strip():
+    total_tests = len(tests)
+    max_time_ms = 0
+    max_memory_kb = None
+    limits = {
+        "time_limit_ms": prob.time_limit_ms,
+        # wall time เผื่อไว้สำหรับ I/O และเครื่องที่ตรวจหลายงานพร้อมกัน ตัดสิน time limit จาก CPU time
+        "wall_limit_s": 2 * prob.time_limit_ms / 1000.0 + 1,
+        "memory_limit_kb": prob.memory_limit_mb * 1024,
+    }
+
+    # เตรียม sandbox ของ worker นี้ (หนึ่งโฟลเดอร์ต่อหนึ่งเทสต์ที่รันพร้อมกัน) แล้วใช้ซ้ำทุกเทสต์
+    sandbox_root = base_data_dir / executor.SANDBOX_SUBDIR / f"w{worker}"
+    sandboxes = [executor.Sandbox(sandbox_root / f"s{slot}") for slot in range(min(TEST_PARALLELISM, len(tests)))]
+    for sandbox in sandboxes:
+        sandbox.prepare(exe_path)
+
+    def on_result(i, result):
+        # ส่งผลรายเทสต์ไปให้ browser ทันทีที่เทสต์นั้นเสร็จ
+        events.publish(dict(result, type="test", submission_id=sub.id, user_id=sub.user_id, test=i + 1, total_tests=total_tests))
+
+    results = _run_tests(sandboxes, prob_dir, tests, limits, prob.checker or checker.DEFAULT_MODE, on_result)
+    test_results = []
+    for i, result in enumerate(results, start=1):
+        if result is None:
+            break
+        test_results.append(dict(result, test=i))
+        max_time_ms = max(max_time_ms, result["time_ms"])
+        if result["memory_kb"] is not None:
+            max_memory_kb = max(max_memory_kb or 0, result["memory_kb"])
+        verdict = result["verdict"]
+        if verdict in FATAL_VERDICTS:
+            return False, verdict, compile_out, f"Test {i}: {result['detail']}", max_time_ms, max_memory_kb, passed_tests, total_tests, test_results
+        if verdict == "passed":
             passed_tests += 1
 
     if passed_tests == total_tests:
-        return True, "accepted", compile_out, "OK", total_ms, max_memory_kb, passed_tests, total_tests
+        return True, "accepted", compile_out, "OK", max_time_ms, max_memory_kb, passed_tests, total_tests, test_results
+    else:
+        return False, "wrong_answer", compile_out, f"Passed {passed_tests}/{total_tests} tests", max_time_ms, max_memory_kb, passed_tests, total_tests, test_results
+
+def _run_tests(sandboxes: List[executor.Sandbox], prob_dir: Path, tests: List[dict], limits: dict, checker_mode: str,
+               on_result=None) -> List[Optional[dict]]:
+    """Run every manifest testcase and return the results in testcase order.
+
+    on_result(i, result) is called as each test finishes (in completion
+    order when tests run in parallel).
+
+    A time limit, memory limit or runtime error ends judging, so once test i is fatal the
+    tests after it are skipped (or killed if already running) and come back
+    as None. Every test before the first fatal one always runs to
+    completion, so the outcome is the same as running them one by one.
+    """
+    if len(sandboxes) <= 1 or len(tests) <= 1:
+        results = [None] * len(tests)
+        for i, test in enumerate(tests):
+            results[i] = _run_test(sandboxes[0], prob_dir, test, limits, checker_mode)
+            if on_result:
+                on_result(i, results[i])
+            if results[i]["verdict"] in FATAL_VERDICTS:
+                break
+        return results
+
+    lock = threading.Lock()
+    cutoff = [len(tests)]
+    running = {}
+    free = queue.SimpleQueue()
+    for sandbox in sandboxes:
+        free.put(sandbox)
+
+    def on_start(i, process):
+        with lock:
+            running[i] = process
+            if i > cutoff[0]:
+                executor.kill(process)
+
+    def job(i, test):
+        with lock:
+            if i > cutoff[0]:
+                return None
+        sandbox = free.get()
+        try:
+            result = _run_test(sandbox, prob_dir, test, limits, checker_mode, on_start=lambda p: on_start(i, p))
+        finally:
+            free.put(sandbox)
+        with lock:
+            running.pop(i, None)
+            if result["verdict"] in FATAL_VERDICTS and i < cutoff[0]:
+                cutoff[0] = i
+                # ผลของเทสต์ที่อยู่หลัง i เปลี่ยน verdict ไม่ได้แล้ว หยุดทิ้งได้เลย
+                for j, process in running.items():
+                    if j > i:
+                        executor.kill(process)
+            skipped = i > cutoff[0]
+        if on_result and not skipped:
+            on_result(i, result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(sandboxes)) as pool:
+        futures = [pool.submit(job, i, test) for i, test in enumerate(tests)]
+        results = [f.result() for f in futures]
+    return [r if i <= cutoff[0] else None for i, r in enumerate(results)]
+
+def _run_test(sandbox: executor.Sandbox, prob_dir: Path, test: dict, limits: dict, checker_mode: str, on_start=None) -> dict:
+    """Run one testcase and return its result.
+
+    The result has verdict (passed | failed | time_limit | memory_limit |
+    runtime_error), detail, time_ms (CPU), wall_ms and memory_kb (peak RSS or None).
+    stdout is checked while the program is still running, so the output is
+    never held in memory as a whole and judging stops at the first mismatch.
+    """
+    def consume(stdout):
+        try:
+            with testcases.open_expected(prob_dir, test) as expected:
+                return checker.check(stdout, expected, checker_mode)
+        except checker.OutputLimitExceeded as e:
+            return False, str(e)
+
+    run = sandbox.run(testcases.read_input(prob_dir, test), limits, consume, on_start=on_start)
+    result = {"verdict": "runtime_error", "detail": "", "time_ms": run["time_ms"], "wall_ms": run["wall_ms"], "memory_kb": run["memory_kb"]}
+    returncode = run["returncode"]
+
+    if run["killed_for"] == "time_limit" or run["time_ms"] > limits["time_limit_ms"]:
+        result.update(verdict="time_limit", detail="time limit exceeded")
+    elif (run["killed_for"] == "memory_limit" or (run["memory_kb"] or 0) > limits["memory_limit_kb"]
+          or _allocation_failed(run)):
+        result.update(verdict="memory_limit", detail="memory limit exceeded")
+    elif run["error"] is not None:
+        result.update(verdict="runtime_error", detail=run["error"])
+    elif returncode != 0 and not (run["killed_by_judge"] and returncode == executor.KILLED_BY_JUDGE):
+        detail = _describe_exit(returncode)
+        if run["stderr"].strip():
+            detail += "\n" + run["stderr"].strip()
+        result.update(verdict="runtime_error", detail=detail)
+    elif run["ok"]:
+        result.update(verdict="passed", detail="")
     else:
-        return False, "wrong_answer", compile_out, f"Passed {passed_tests}/{total_tests} tests", total_ms, max_memory_kb, passed_tests, total_tests
\ No newline at end of file
+        result.update(verdict="failed", detail=run["message"])
+    return result
+
+def _allocation_failed(run: dict) -> bool:
+    """Whether the program died because new/malloc hit the RLIMIT_AS safety cap."""
+    return run["returncode"] not in (0, None) and any(marker in run["stderr"] for marker in ALLOCATION_FAILURE_MARKERS)
+
+def _describe_exit(returncode: int) -> str:
+    if returncode < 0:
+        try:
+            return f"killed by signal {signal.Signals(-returncode).name}"
+        except ValueError:
+            return f"killed by signal {-returncode}"
+    return f"exit code {returncode}"
\ No newline at end of file
@@ -0,0 +1,244 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+# testcase แต่ละชุดอยู่ที่ <problem>/versions/<n>/ และไม่ถูกแก้ไขอีกหลังสร้าง
+# ไฟล์ CURRENT ชี้ไปยังชุดที่ใช้ตรวจ submission ใหม่ (เปลี่ยนด้วย rename ครั้งเดียว)
+VERSIONS_DIR = "versions"
+CURRENT_NAME = "CURRENT"
+CACHE_MAX_BYTES = int(os.getenv("GRADER_TESTCASE_CACHE_MB", "128")) * 1024 * 1024
+# ไฟล์ที่ใหญ่กว่านี้จะไม่ถูกเก็บใน cache (อ่านจากดิสก์ทุกครั้ง) เพื่อไม่ให้ไล่ไฟล์อื่นออกหมด
+CACHE_MAX_ENTRY_BYTES = CACHE_MAX_BYTES // 8
+# ขีดจำกัดของไฟล์ zip testcase ที่อัปโหลด (ขนาดหลังแตกไฟล์ และจำนวนไฟล์)
+EXTRACT_MAX_BYTES = int(os.getenv("GRADER_TESTCASE_MAX_MB", "2048")) * 1024 * 1024
+EXTRACT_MAX_FILES = int(os.getenv("GRADER_TESTCASE_MAX_FILES", "10000"))
+EXTRACT_CHUNK = 1 << 20
+
+_INPUT_RE = re.compile(r"^input(.*)\.txt$")
+
+_lock = threading.Lock()
+_install_lock = threading.Lock()
+_manifests = {}
+_data = OrderedDict()
+_data_bytes = 0
+
+def natural_key(text: str):
+    """Sort key that orders input2 before input10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", text)]
+
+class ArchiveError(Exception):
+    pass
+
+def _file_info(path: Path) -> Tuple[int, str]:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return path.stat().st_size, h.hexdigest()
+
+def build_manifest(prob_dir: Path, files: Optional[Dict[str, Tuple[int, str]]] = None) -> dict:
+    """Pair every inputN.txt with its outputN.txt under prob_dir and write manifest.json.
+
+    Called when testcases are uploaded or replaced; the judge only reads the
+    manifest afterwards instead of walking the directory per submission.
+    files maps paths relative to prob_dir to (size, sha256); when it is
+    given (extract_zip already hashed everything while writing) the
+    directory is not read again.
+    """
+    if files is None:
+        files = {}
+        for path in list(prob_dir.rglob("input*.txt")) + list(prob_dir.rglob("output*.txt")):
+            rel = path.relative_to(prob_dir)
+            # version 0 คือ directory ของโจทย์เอง ต้องไม่นับไฟล์ของ version อื่นที่อยู่ข้างใน
+            if rel.parts[0] == VERSIONS_DIR:
+                continue
+            files[rel.as_posix()] = _file_info(path)
+
+    tests = []
+    unmatched = []
+    for rel_in, (in_size, in_hash) in files.items():
+        path = PurePosixPath(rel_in)
+        m = _INPUT_RE.match(path.name)
+        if not m:
+            continue
+        rel_out = path.with_name(f"output{m.group(1)}.txt").as_posix()
+        if rel_out not in files:
+            unmatched.append(rel_in)
+            continue
+        out_size, out_hash = files[rel_out]
+        tests.append({
+            "input": rel_in,
+            "output": rel_out,
+            "input_size": in_size,
+            "output_size": out_size,
+            "input_sha256": in_hash,
+            "output_sha256": out_hash,
+        })
+    # outputN.txt ที่ไม่มี inputN.txt คู่กัน
+    for rel_out in files:
+        path = PurePosixPath(rel_out)
+        if path.name.startswith("output") and path.name.endswith(".txt"):
+            if path.with_name("input" + path.name[len("output"):]).as_posix() not in files:
+                unmatched.append(rel_out)
+
+    tests.sort(key=lambda t: natural_key(t["input"]))
+    manifest = {"tests": tests, "unmatched": sorted(unmatched, key=natural_key)}
+
+    prob_dir.mkdir(parents=True, exist_ok=True)
+    tmp = prob_dir / f"{MANIFEST_NAME}.{threading.get_ident()}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, prob_dir / MANIFEST_NAME)
+    invalidate(prob_dir)
+    return manifest
+
+def _member_path(name: str) -> Optional[PurePosixPath]:
+    """Safe relative path of a zip member, or None for directories; raises on paths escaping the target."""
+    name = name.replace("\\", "/")
+    if name.endswith("/"):
+        return None
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts or (path.parts and ":" in path.parts[0]):
+        raise ArchiveError(f"unsafe path in archive: {name}")
+    return path
+
+def extract_zip(zip_path: Path, dest_dir: Path, prefix: str = "") -> Dict[str, Tuple[int, str]]:
+    """Extract zip_path into dest_dir chunk by chunk, hashing each file as it is written.
+
+    Blocking; call it off the event loop. The real number of bytes written
+    is counted (header sizes are not trusted) and extraction stops with
+    ArchiveError past EXTRACT_MAX_BYTES or EXTRACT_MAX_FILES. Returns
+    {prefix + relative path: (size, sha256)} for build_manifest.
+    """
+    files = {}
+    total = 0
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"not a zip file: {e}")
+    with zf:
+        members = [(info, _member_path(info.filename)) for info in zf.infolist()]
+        members = [(info, path) for info, path in members if path is not None]
+        if len(members) > EXTRACT_MAX_FILES:
+            raise ArchiveError(f"archive has {len(members)} files (limit {EXTRACT_MAX_FILES})")
+        for info, path in members:
+            target = dest_dir.joinpath(*path.parts)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            h = hashlib.sha256()
+            size = 0
+            with zf.open(info) as src, target.open("wb") as dst:
+                for chunk in iter(lambda: src.read(EXTRACT_CHUNK), b""):
+                    size += len(chunk)
+                    total += len(chunk)
+                    if total > EXTRACT_MAX_BYTES:
+                        raise ArchiveError(f"archive expands to more than {EXTRACT_MAX_BYTES // (1024 * 1024)} MB")
+                    h.update(chunk)
+                    dst.write(chunk)
+            files[prefix + path.as_posix()] = (size, h.hexdigest())
+    return files
+
+def version_dir(prob_dir: Path, version: int) -> Path:
+    """Directory of testcase set `version`; version 0 is the problem directory itself (problems from before versioning)."""
+    return prob_dir if version == 0 else prob_dir / VERSIONS_DIR / str(version)
+
+def current_version(prob_dir: Path) -> int:
+    try:
+        return int((prob_dir / CURRENT_NAME).read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def list_versions(prob_dir: Path) -> List[int]:
+    versions = []
+    if prob_dir.is_dir() and any(p.name not in (VERSIONS_DIR, CURRENT_NAME) for p in prob_dir.iterdir()):
+        versions.append(0)
+    root = prob_dir / VERSIONS_DIR
+    if root.is_dir():
+        versions.extend(sorted(int(p.name) for p in root.iterdir() if p.name.isdigit()))
+    return versions
+
+def install_version(prob_dir: Path, staging: Path, files: Dict[str, Tuple[int, str]]) -> Tuple[int, dict]:
+    """Turn a fully extracted staging directory into the next version and point CURRENT at it.
+
+    staging must be on the same filesystem as prob_dir (it is renamed, not
+    copied). Earlier versions are left in place, so submissions being
+    judged against them are not disturbed. Returns (version, manifest).
+    """
+    manifest = build_manifest(staging, files)
+    invalidate(staging)
+    with _install_lock:
+        root = prob_dir / VERSIONS_DIR
+        root.mkdir(parents=True, exist_ok=True)
+        version = max(list_versions(prob_dir) + [0]) + 1
+        os.replace(staging, root / str(version))
+        tmp = prob_dir / f"{CURRENT_NAME}.{threading.get_ident()}.tmp"
+        tmp.write_text(str(version))
+        os.replace(tmp, prob_dir / CURRENT_NAME)
+    return version, manifest
+
+def load_manifest(prob_dir: Path) -> dict:
+    """Return the (cached) manifest of prob_dir, building it for problems uploaded before manifests existed."""
+    key = str(prob_dir)
+    with _lock:
+        manifest = _manifests.get(key)
+    if manifest is not None:
+        return manifest
+
+    path = prob_dir / MANIFEST_NAME
+    if path.exists():
+        manifest = json.loads(path.read_text())
+    else:
+        manifest = build_manifest(prob_dir)
+    with _lock:
+        _manifests[key] = manifest
+    return manifest
+
+def invalidate(prob_dir: Path):
+    """Forget the cached manifest and testcase data of prob_dir."""
+    global _data_bytes
+    prefix = str(prob_dir)
+    with _lock:
+        _manifests.pop(prefix, None)
+        for key in [k for k in _data if k[0] == prefix]:
+            _data_bytes -= len(_data.pop(key))
+
+def _cached(prob_dir: Path, rel: str, loader):
+    global _data_bytes
+    key = (str(prob_dir), rel)
+    with _lock:
+        value = _data.get(key)
+        if value is not None:
+            _data.move_to_end(key)
+            return value
+
+    value = loader(prob_dir / rel)
+    if len(value) > CACHE_MAX_ENTRY_BYTES:
+        return value
+    with _lock:
+        if key not in _data:
+            _data[key] = value
+            _data_bytes += len(value)
+            while _data_bytes > CACHE_MAX_BYTES:
+                _, old = _data.popitem(last=False)
+                _data_bytes -= len(old)
+    return value
+
+def read_input(prob_dir: Path, test: dict) -> bytes:
+    return _cached(prob_dir, test["input"], lambda p: p.read_bytes())
+
+def open_expected(prob_dir: Path, test: dict) -> BinaryIO:
+    """Binary stream of the expected output: served from the cache when it fits, otherwise read from disk."""
+    if test.get("output_size", 0) > CACHE_MAX_ENTRY_BYTES:
+        return (prob_dir / test["output"]).open("rb")
+    return io.BytesIO(_cached(prob_dir, test["output"], lambda p: p.read_bytes()))
+
+def get_testcases(prob_dir: Path) -> Tuple[List[dict], List[str]]:
+    """Return (tests, unmatched) for a testcase directory (see version_dir) in natural order."""
+    manifest = load_manifest(prob_dir)
+    return manifest["tests"], manifest["unmatched"]
@@ -1,6 +1,6 @@
 from typing import Optional
 from datetime import datetime
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, UniqueConstraint
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -17,10 +17,14 @@ class Problem(SQLModel, table=True):
     slug: str
     description: Optional[str] = None
     pdf_path: Optional[str] = None
+    pdf_size: Optional[int] = None
+    pdf_sha256: Optional[str] = None  # ใช้เป็น ETag และ ?v= ของลิงก์ PDF
+    pdf_pages: Optional[int] = None
     time_limit_ms: int = 2000
     memory_limit_mb: int = 256
     max_score: int = 100
     testcase_count: int = 0
+    checker: str = "exact"  # exact | tokens | float
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Submission(SQLModel, table=True):
@@ -30,7 +34,7 @@ class Submission(SQLModel, table=True):
     user_name: str
     language: str  # "c" | "cpp"
     source_path: str
-    status: str = "queued"  # queued | running | accepted | wrong_answer | runtime_error | time_limit | compile_error | internal_error
+    status: str = "queued"  # queued | running | accepted | wrong_answer | runtime_error | time_limit | memory_limit | compile_error | internal_error
     score: int = 0
     max_score: int = 100
     passed_tests: int = 0
@@ -39,5 +43,44 @@ class Submission(SQLModel, table=True):
     run_output: Optional[str] = None
     exec_time_ms: Optional[int] = None
     memory_used_kb: Optional[int] = None
+    test_results: Optional[str] = None  # JSON: per-test verdict, time_ms, wall_ms, memory_kb
+    testcase_version: Optional[int] = None  # ชุด testcase ที่ใช้ตรวจ (ดู judge/testcases.py)
+    rejudge_batch_id: Optional[int] = None  # ถูกส่งตรวจใหม่โดย RejudgeBatch นี้ (คิว priority ต่ำ)
+    queue_wait_ms: Optional[int] = None  # เวลาที่รอในคิวก่อน judge หยิบไปตรวจ (ครั้งล่าสุด)
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RejudgeBatch(SQLModel, table=True):
+    """One bulk rejudge; its submissions point back here through Submission.rejudge_batch_id."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_by: int
+    problem_id: Optional[int] = None
+    user_id: Optional[int] = None
+    status_filter: Optional[str] = None
+    testcase_version: Optional[int] = None
+    total: int = 0
+    distinct_sources: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BestScore(SQLModel, table=True):
+    """Best score of one user on one problem, maintained by the judge when a verdict lands."""
+    __table_args__ = (UniqueConstraint("user_id", "problem_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    problem_id: int
+    best_score: int = 0
+    max_score: int = 100
+    attempts: int = 0  # จำนวน submission ที่ตรวจเสร็จแล้วของโจทย์นี้
+    improved_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UserStats(SQLModel, table=True):
+    """Per-user totals, updated incrementally by the judge from bestscore changes."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(unique=True)
+    user_name: Optional[str] = Field(default=None, unique=True)  # username (ไม่ใช่ display name ที่เปลี่ยนได้)
+    total_score: int = 0  # ผลรวม best score ของทุกโจทย์
+    total_submissions: int = 0  # จำนวน submission ที่ตรวจเสร็จแล้ว
+    problems_solved: int = 0
+    last_activity: Optional[datetime] = None
@@ -1,70 +1,86 @@
-from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select, func
 from pathlib import Path
 from datetime import datetime
 
-from app.db import engine
-from app.models import User, Submission, Problem
+from app import cache, scoreboard
+from app.models import User
 from app.auth import get_current_user
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent.parent / "templates"))
+MAX_TOP = 500
+
+def _row(stat: dict, rank: int) -> dict:
+    return dict(stat, rank=rank, last_improved=stat['last_improved'].isoformat())
 
 @router.get("/", response_class=HTMLResponse)
 def leaderboard(request: Request, current_user: User = Depends(get_current_user)):
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
     
-    with Session(engine) as session:
-        # คำนวณคะแนนรวมและจำนวนโจทย์ที่แก้ได้ (ไม่รวม admin)
-        stats = session.exec(
-            select(
-                User.id,
-                User.display_name,
-                func.sum(Submission.score).label('total_score'),
-                func.count(func.distinct(Submission.problem_id)).label('problems_solved'),
-                func.count(Submission.id).label('total_submissions')
-            )
-            .join(Submission, User.id == Submission.user_id)
-            .where(Submission.status == "accepted", User.is_admin == False)
-            .group_by(User.id, User.display_name)
-            .order_by(func.sum(Submission.score).desc())
-        ).all()
-        
-        # แปลง stats เป็น list ของ dictionaries และเพิ่มข้อมูลโจทย์ที่ทำได้
-        stats_list = []
-        for stat in stats:
-            # ดึงเฉพาะปัญหาที่แก้ได้ครั้งแรก (first accepted submission)
-            solved_problems = session.exec(
-                select(Submission.problem_id, Submission.score, Problem.max_score)
-                .join(Problem, Submission.problem_id == Problem.id)
-                .where(Submission.user_id == stat.id, Submission.status == "accepted")
-                .order_by(Submission.problem_id, Submission.id.asc())
-            ).all()
-            
-            # กรองให้เหลือเฉพาะปัญหาที่แก้ได้ครั้งแรก
-            unique_problems = {}
-            for problem in solved_problems:
-                if problem.problem_id not in unique_problems:
-                    unique_problems[problem.problem_id] = problem
-            
-            solved_problems = list(unique_problems.values())
-            
-            stat_dict = {
-                'id': stat.id,
-                'display_name': stat.display_name,
-                'total_score': stat.total_score or 0,
-                'problems_solved': stat.problems_solved or 0,
-                'total_submissions': stat.total_submissions or 0,
-                'solved_problems': solved_problems
-            }
-            stats_list.append(stat_dict)
+    # admin เห็นอันดับสดเสมอ คนอื่นเห็น snapshot ถ้า scoreboard ถูก freeze อยู่
+    live = current_user.is_admin
+    frozen_at = scoreboard.frozen_at()
+    show_frozen = frozen_at is not None and not live
+    
+    def render():
+        return templates.get_template("leaderboard_table.html").render(
+            stats=scoreboard.standings(live=live),
+            current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        )
+    
+    # ตารางเดียวกันสำหรับทุกคน: render ใหม่เฉพาะเมื่อมีผลตรวจใหม่ มีคนเปลี่ยนชื่อ หรือ freeze/unfreeze
+    if show_frozen:
+        board = cache.get_or_render(("leaderboard", "frozen"), ("scoreboard",), render)
+    else:
+        board = cache.get_or_render(("leaderboard", "live"), ("verdicts", "users"), render)
     
     return templates.TemplateResponse("leaderboard.html", {
         "request": request, 
-        "stats": stats_list,
+        "board": board,
         "user": current_user,
-        "current_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
\ No newline at end of file
+        "frozen_at": frozen_at,
+        "my_rank": None if live else scoreboard.rank(current_user.id)
+    })
+
+@router.get("/rank/{user_id}")
+def user_rank(user_id: int, current_user: User = Depends(get_current_user)):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    live = current_user.is_admin
+    stat = scoreboard.entry(user_id, live=live)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="User is not on the scoreboard")
+    return JSONResponse(_row(stat, scoreboard.rank(user_id, live=live)))
+
+@router.get("/top")
+def top(k: int = 10, current_user: User = Depends(get_current_user)):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    k = max(1, min(k, MAX_TOP))
+    rows = scoreboard.top(k, live=current_user.is_admin)
+    frozen_at = scoreboard.frozen_at()
+    return JSONResponse({
+        "frozen_at": frozen_at.isoformat() if frozen_at and not current_user.is_admin else None,
+        "standings": [_row(stat, rank) for rank, stat in enumerate(rows, start=1)],
+    })
+
+@router.post("/freeze")
+def freeze(current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can freeze the scoreboard")
+    
+    scoreboard.freeze()
+    return RedirectResponse(url="/leaderboard/", status_code=303)
+
+@router.post("/unfreeze")
+def unfreeze(current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can unfreeze the scoreboard")
+    
+    scoreboard.unfreeze()
+    return RedirectResponse(url="/leaderboard/", status_code=303)
@@ -1,69 +1,231 @@
 from fastapi import APIRouter, Request, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
-import zipfile, io, re, aiofiles, os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+import re, aiofiles, os, shutil, uuid, hashlib, threading
 import PyPDF2
 
 from app.db import engine
-from app.models import Problem, User, Submission
+from app import cache
+from app.models import Problem, User, BestScore
 from app.auth import get_current_user
+from app.judge import testcases
+from app.judge import checker as checker_module
 
 router = APIRouter(prefix="/problems", tags=["problems"])
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent.parent / "templates"))
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+# ไฟล์อัปโหลดถูกเขียนลงดิสก์ทีละ chunk ไม่อ่านทั้งก้อนเข้า memory
+UPLOAD_DIR = DATA_DIR / "uploads"
+UPLOAD_CHUNK = 1 << 20
+MAX_UPLOAD_BYTES = int(os.getenv("GRADER_MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+
+async def _save_upload(upload: UploadFile, dest: Path) -> int:
+    """Copy an uploaded file to dest chunk by chunk; 413 (and no partial file) past MAX_UPLOAD_BYTES."""
+    size = 0
+    try:
+        async with aiofiles.open(dest, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File too large (limit {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)")
+                await f.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    return size
+
+async def _extract_upload(testcases_zip: UploadFile, token: str) -> dict:
+    """Save the zip under UPLOAD_DIR and extract it into a staging directory in a worker thread.
+
+    Returns the file info from testcases.extract_zip; the staging directory
+    is UPLOAD_DIR / token and is removed again if the archive is rejected.
+    """
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    zip_path = UPLOAD_DIR / f"{token}.zip"
+    staging = UPLOAD_DIR / token
+    try:
+        await _save_upload(testcases_zip, zip_path)
+        return await run_in_threadpool(testcases.extract_zip, zip_path, staging)
+    except testcases.ArchiveError as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=f"Invalid testcases zip: {e}")
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        zip_path.unlink(missing_ok=True)
+
+# PDF โจทย์ถูกเปิดพร้อมกันทุกคนตอนเริ่มแข่ง: เก็บ ETag/ขนาดไว้ใน memory ไม่ต้องเปิด session ทุกครั้ง
+PDF_CHUNK = 256 * 1024
+PDF_IMMUTABLE = "private, max-age=31536000, immutable"
+_pdf_lock = threading.Lock()
+_pdf_meta = {}
+
+def _pdf_info(path: Path) -> dict:
+    """Size, sha256 and page count of a statement PDF; pdf_pages is None when PyPDF2 cannot parse it."""
+    h = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+            h.update(chunk)
+    try:
+        pages = len(PyPDF2.PdfReader(str(path)).pages)
+    except Exception:
+        pages = None
+    return {"pdf_size": path.stat().st_size, "pdf_sha256": h.hexdigest(), "pdf_pages": pages}
+
+def _pdf_entry(problem_id: int) -> Optional[dict]:
+    """Path, ETag and stat info of a problem's PDF, from memory while the file is unchanged."""
+    with _pdf_lock:
+        meta = _pdf_meta.get(problem_id)
+    stale = False
+    if meta is not None:
+        try:
+            st = os.stat(meta["path"])
+            if (st.st_mtime, st.st_size) == (meta["mtime"], meta["size"]):
+                return meta
+        except FileNotFoundError:
+            pass
+        stale = True
+    
+    with Session(engine) as session:
+        problem = session.get(Problem, problem_id)
+        if not problem or not problem.pdf_path or not os.path.isfile(problem.pdf_path):
+            return None
+        path = Path(problem.pdf_path)
+        st = path.stat()
+        # โจทย์ที่อัปโหลดก่อนมีข้อมูลนี้ หรือไฟล์ถูกแทนที่: คำนวณครั้งเดียวแล้วเก็บลงฐานข้อมูล
+        if stale or not problem.pdf_sha256 or problem.pdf_size != st.st_size:
+            for key, value in _pdf_info(path).items():
+                setattr(problem, key, value)
+            session.add(problem)
+            session.commit()
+        meta = {
+            "path": str(path),
+            "etag": f'"{problem.pdf_sha256[:32]}"',
+            "version": problem.pdf_sha256[:16],
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "last_modified": formatdate(st.st_mtime, usegmt=True),
+        }
+    with _pdf_lock:
+        _pdf_meta[problem_id] = meta
+    return meta
+
+def _not_modified(request: Request, meta: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or meta["etag"] in tags or f"W/{meta['etag']}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(meta["mtime"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _parse_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=" range, None if unsatisfiable, False to ignore it and send the whole file."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return False
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return False
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # bytes=-N คือ N ไบต์สุดท้าย
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return False
+    if start < 0 or start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+def _iter_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(PDF_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _install_testcases(staging: Path, prob_dir: Path, files: dict) -> dict:
+    # staging กลายเป็น testcase version ใหม่ของโจทย์ (hash ถูกคำนวณไปแล้วระหว่างแตกไฟล์)
+    _, manifest = testcases.install_version(prob_dir, staging, files)
+    return manifest
 
 @router.get("/", response_class=HTMLResponse)
 def list_problems(request: Request, current_user: User = Depends(get_current_user), search: str = ""):
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
     
-    with Session(engine) as session:
-        # สร้าง query พื้นฐาน
-        query = select(Problem)
+    # ตารางโจทย์ของ user นี้ render ใหม่เฉพาะเมื่อมีโจทย์เปลี่ยนหรือ user นี้ได้ผลตรวจใหม่
+    def render():
+        with Session(engine) as session:
+            # สร้าง query พื้นฐาน: best score ของ user นี้มาจากตาราง bestscore ด้วย outer join ใน query เดียว
+            query = select(Problem, BestScore.best_score).outerjoin(
+                BestScore,
+                (BestScore.problem_id == Problem.id) & (BestScore.user_id == current_user.id),
+            )
         
-        # เพิ่มเงื่อนไข search ถ้ามี
-        if search.strip():
-            query = query.where(Problem.title.contains(search.strip()))
+            # เพิ่มเงื่อนไข search ถ้ามี
+            if search.strip():
+                query = query.where(Problem.title.contains(search.strip()))
         
-        problems = session.exec(query.order_by(Problem.id.desc())).all()
+            rows = session.exec(query.order_by(Problem.id.desc())).all()
         
-        # เพิ่มข้อมูลสถานะการทำของแต่ละโจทย์สำหรับ user ปัจจุบัน
-        problems_with_status = []
-        for problem in problems:
-            # หา submission ที่ดีที่สุดของ user นี้สำหรับโจทย์นี้
-            best_submission = session.exec(
-                select(Submission)
-                .where(Submission.user_id == current_user.id, Submission.problem_id == problem.id)
-                .order_by(Submission.score.desc())
-            ).first()
+            # เพิ่มข้อมูลสถานะการทำของแต่ละโจทย์สำหรับ user ปัจจุบัน
+            problems_with_status = []
+            for problem, best_score in rows:
+                problem_dict = {
+                    'id': problem.id,
+                    'title': problem.title,
+                    'max_score': problem.max_score,
+                    'testcase_count': problem.testcase_count,
+                    'pdf_path': problem.pdf_path,
+                    'pdf_sha256': problem.pdf_sha256,
+                    'description': problem.description,
+                    'time_limit_ms': problem.time_limit_ms,
+                    'memory_limit_mb': problem.memory_limit_mb,
+                    'status': 'not_attempted'  # default
+                }
             
-            problem_dict = {
-                'id': problem.id,
-                'title': problem.title,
-                'max_score': problem.max_score,
-                'testcase_count': problem.testcase_count,
-                'pdf_path': problem.pdf_path,
-                'description': problem.description,
-                'time_limit_ms': problem.time_limit_ms,
-                'memory_limit_mb': problem.memory_limit_mb,
-                'status': 'not_attempted'  # default
-            }
+                if best_score is not None:
+                    if best_score >= problem.max_score:
+                        problem_dict['status'] = 'solved'
+                    elif best_score > 0:
+                        problem_dict['status'] = 'partial'
+                    else:
+                        problem_dict['status'] = 'failed'
             
-            if best_submission:
-                if best_submission.score == problem.max_score:
-                    problem_dict['status'] = 'solved'
-                elif best_submission.score > 0:
-                    problem_dict['status'] = 'partial'
-                else:
-                    problem_dict['status'] = 'failed'
-            
-            problems_with_status.append(problem_dict)
+                problems_with_status.append(problem_dict)
+        
+        return templates.get_template("problems_table.html").render(problems=problems_with_status)
     
+    problem_table = cache.get_or_render(
+        ("problems", current_user.id, search.strip()),
+        ("problems", ("verdicts", current_user.id)),
+        render,
+    )
     return templates.TemplateResponse("index.html", {
         "request": request, 
-        "problems": problems_with_status,
+        "problem_table": problem_table,
         "user": current_user,
         "search_query": search.strip()
     })
@@ -89,6 +251,7 @@ async def upload_problem(
     time_limit_ms: int = Form(2000),
     memory_limit_mb: int = Form(256),
     max_score: int = Form(100),
+    checker: str = Form(checker_module.DEFAULT_MODE),
     problem_pdf: UploadFile = File(...),
     testcases_zip: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
@@ -97,44 +260,50 @@ async def upload_problem(
         raise HTTPException(status_code=403, detail="Only admins can upload problems")
     
     slug = re.sub(r"[^a-z0-9-]", "-", slug.lower())
+    if checker not in checker_module.MODES:
+        raise HTTPException(status_code=400, detail=f"checker must be one of {', '.join(checker_module.MODES)}")
     
-    # บันทึก PDF
-    pdf_path = DATA_DIR / "pdfs" / f"{slug}.pdf"
-    async with aiofiles.open(pdf_path, 'wb') as f:
-        content = await problem_pdf.read()
-        await f.write(content)
-    
-    # นับจำนวน testcases (ดูจาก basename เพื่อรองรับโฟลเดอร์ซ้อน)
-    data = await testcases_zip.read()
-    with zipfile.ZipFile(io.BytesIO(data)) as zf:
-        names = zf.namelist()
-        basenames = [os.path.basename(n) for n in names if not n.endswith("/")]
-        input_files = [n for n in basenames if n.startswith('input') and n.endswith('.txt')]
-        output_files = [n for n in basenames if n.startswith('output') and n.endswith('.txt')]
-        testcase_count = min(len(input_files), len(output_files))
+    # แตก testcases ก่อน (ใน thread แยก) เพื่อให้ zip ที่ใช้ไม่ได้ถูกปฏิเสธก่อนสร้างโจทย์
+    token = uuid.uuid4().hex
+    staging = UPLOAD_DIR / token
+    files = await _extract_upload(testcases_zip, token)
     
-    with Session(engine) as session:
-        problem = Problem(
-            title=title, 
-            slug=slug, 
-            description=description,
-            pdf_path=str(pdf_path),
-            time_limit_ms=time_limit_ms, 
-            memory_limit_mb=memory_limit_mb,
-            max_score=max_score,
-            testcase_count=testcase_count
-        )
-        session.add(problem)
-        session.commit()
-        session.refresh(problem)
+    try:
+        # บันทึก PDF
+        pdf_path = DATA_DIR / "pdfs" / f"{slug}.pdf"
+        pdf_path.parent.mkdir(parents=True, exist_ok=True)
+        await _save_upload(problem_pdf, pdf_path)
+        pdf_info = await run_in_threadpool(_pdf_info, pdf_path)
         
-        # บันทึก testcases
-        prob_dir = DATA_DIR / "problems" / str(problem.id)
-        prob_dir.mkdir(parents=True, exist_ok=True)
-        with zipfile.ZipFile(io.BytesIO(data)) as zf:
-            zf.extractall(prob_dir)
+        with Session(engine) as session:
+            problem = Problem(
+                title=title, 
+                slug=slug, 
+                description=description,
+                pdf_path=str(pdf_path),
+                **pdf_info,
+                time_limit_ms=time_limit_ms, 
+                memory_limit_mb=memory_limit_mb,
+                max_score=max_score,
+                testcase_count=0,
+                checker=checker
+            )
+            session.add(problem)
+            session.commit()
+            session.refresh(problem)
+            
+            # testcases ที่แตกไว้กลายเป็น version 1 ของโจทย์
+            prob_dir = DATA_DIR / "problems" / str(problem.id)
+            manifest = await run_in_threadpool(_install_testcases, staging, prob_dir, files)
+            problem.testcase_count = len(manifest["tests"])
+            session.add(problem)
+            session.commit()
+            problem_id = problem.id
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    cache.bump("problems")
     
-    return RedirectResponse(url=f"/problems/{problem.id}", status_code=303)
+    return RedirectResponse(url=f"/problems/{problem_id}", status_code=303)
 
 @router.get("/{problem_id}", response_class=HTMLResponse)
 def problem_detail(problem_id: int, request: Request, current_user: User = Depends(get_current_user)):
@@ -161,10 +330,13 @@ def edit_testcases_form(request: Request, problem_id: int, current_user: User =
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
     
+    prob_dir = DATA_DIR / "problems" / str(problem_id)
     return templates.TemplateResponse("edit_testcases.html", {
         "request": request, 
         "problem": problem,
-        "user": current_user
+        "user": current_user,
+        "versions": testcases.list_versions(prob_dir),
+        "current_version": testcases.current_version(prob_dir)
     })
 
 @router.post("/{problem_id}/edit-testcases")
@@ -182,21 +354,16 @@ async def edit_testcases(
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    # อัปเดต testcases
-    testcase_dir = DATA_DIR / "problems" / str(problem_id)
-    testcase_dir.mkdir(parents=True, exist_ok=True)
-    
-    # ลบ testcases เก่า
-    import shutil
-    if (testcase_dir / "testcases").exists():
-        shutil.rmtree(testcase_dir / "testcases")
-    
-    # เก็บ testcases ใหม่
-    with zipfile.ZipFile(io.BytesIO(await testcases_zip.read()), 'r') as zip_ref:
-        zip_ref.extractall(testcase_dir / "testcases")
-    
-    # นับจำนวน testcases
-    testcase_count = len([f for f in (testcase_dir / "testcases").iterdir() if f.suffix == '.in'])
+    # แตก testcases ใหม่ไว้ที่อื่นก่อน แล้วเพิ่มเป็น version ใหม่ ชุดเก่าไม่ถูกแตะ
+    # submission ที่กำลังตรวจอยู่จึงใช้ชุดเดิมต่อจนจบ ส่วน submission ใหม่ใช้ชุดนี้
+    token = uuid.uuid4().hex
+    staging = UPLOAD_DIR / token
+    files = await _extract_upload(testcases_zip, token)
+    try:
+        manifest = await run_in_threadpool(_install_testcases, staging, DATA_DIR / "problems" / str(problem_id), files)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    testcase_count = len(manifest["tests"])
     
     # อัปเดตข้อมูลในฐานข้อมูล
     with Session(engine) as session:
@@ -204,16 +371,40 @@ async def edit_testcases(
         problem.testcase_count = testcase_count
         session.add(problem)
         session.commit()
+    cache.bump("problems")
     
     return RedirectResponse(url=f"/problems/{problem_id}", status_code=303)
 
 @router.get("/{problem_id}/pdf")
-def get_pdf(problem_id: int, current_user: User = Depends(get_current_user)):
+def get_pdf(request: Request, problem_id: int, v: str = "", current_user: User = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    with Session(engine) as session:
-        problem = session.get(Problem, problem_id)
-    if not problem or not problem.pdf_path:
+    meta = _pdf_entry(problem_id)
+    if not meta:
         raise HTTPException(status_code=404, detail="PDF not found")
-    return FileResponse(problem.pdf_path, media_type="application/pdf")
\ No newline at end of file
+    
+    # ลิงก์ที่มี ?v=<hash> ของเนื้อหาปัจจุบัน cache ได้ตลอด ส่วน URL เปล่าต้องถามใหม่ (ได้ 304 ถ้าไม่เปลี่ยน)
+    headers = {
+        "ETag": meta["etag"],
+        "Last-Modified": meta["last_modified"],
+        "Accept-Ranges": "bytes",
+        "Cache-Control": PDF_IMMUTABLE if v and v == meta["version"] else "private, no-cache",
+    }
+    if _not_modified(request, meta):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == meta["etag"]):
+        byte_range = _parse_range(range_header, meta["size"])
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{meta['size']}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{meta['size']}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(_iter_file(meta["path"], start, end), status_code=206,
+                                     media_type="application/pdf", headers=headers)
+    
+    return FileResponse(meta["path"], media_type="application/pdf", headers=headers, stat_result=os.stat(meta["path"]))
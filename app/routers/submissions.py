@@ -1,73 +1,378 @@
 from fastapi import APIRouter, Request, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func, update, or_
 from pathlib import Path
-import shutil, time
+from typing import Optional
+from urllib.parse import urlencode
+from datetime import datetime
+import shutil, time, json
 
 from app.db import engine
-from app.models import Submission, Problem, User
+from app.models import Submission, Problem, User, RejudgeBatch
 from app.auth import get_current_user
+from app.judge.runner import get_worker_states
+from app import cache, scoreboard
+from app.judge import dispatch, compile_cache, events, testcases
 
 router = APIRouter(prefix="/submissions", tags=["submissions"])
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent.parent / "templates"))
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 
+SUBMISSION_STATUSES = ("queued", "running", "accepted", "wrong_answer", "runtime_error", "time_limit",
+                       "memory_limit", "compile_error", "internal_error")
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def _frozen_since(current_user: User) -> Optional[datetime]:
+    """Freeze time of the scoreboard if current_user must not see other users' later verdicts (non-admins only)."""
+    return None if current_user.is_admin else scoreboard.frozen_at()
+
+def _hidden(user_id: int, updated_at: datetime, viewer_id: Optional[int], frozen_at: Optional[datetime]) -> bool:
+    # ระหว่าง freeze ผลของคนอื่นที่ออก (หรือถูกตรวจใหม่) หลังเวลา freeze ถูกซ่อน
+    return frozen_at is not None and user_id != viewer_id and updated_at >= frozen_at
+
+def _list_page(session: Session, before: Optional[int] = None, after: Optional[int] = None, limit: int = PAGE_SIZE,
+               problem_id: Optional[int] = None, user_id: Optional[int] = None,
+               status: str = "", language: str = "",
+               viewer_id: Optional[int] = None, frozen_at: Optional[datetime] = None) -> dict:
+    """One page of submissions, newest first, using keyset pagination on Submission.id.
+
+    before/after are the ids at the edges of the current page, so a page
+    costs one indexed range scan of `limit` rows no matter how deep it is.
+    Returns {"submissions", "newer", "older"} where newer/older are the
+    cursors for the neighbouring pages (None when there is none).
+    With frozen_at set (see _frozen_since), other users' submissions
+    updated since then are listed with status "frozen" and no score.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = (
+        select(Submission.id, Submission.problem_id, Submission.user_id, Submission.language, Submission.status,
+               Submission.score, Submission.max_score, Submission.passed_tests, Submission.total_tests,
+               Submission.created_at, Submission.updated_at, Problem.title, User.display_name)
+        .join(Problem, Submission.problem_id == Problem.id)
+        .join(User, Submission.user_id == User.id)
+    )
+    if problem_id:
+        query = query.where(Submission.problem_id == problem_id)
+    if user_id:
+        query = query.where(Submission.user_id == user_id)
+    if status:
+        query = query.where(Submission.status == status)
+        if frozen_at is not None:
+            # filter ตาม status ต้องไม่บอกผลที่ถูกซ่อนอยู่
+            query = query.where(or_(Submission.user_id == viewer_id, Submission.updated_at < frozen_at))
+    if language:
+        query = query.where(Submission.language == language)
+
+    # ขอเกินมาหนึ่งแถวเพื่อดูว่ายังมีหน้าถัดไปไหม
+    if after is not None:
+        rows = session.exec(query.where(Submission.id > after).order_by(Submission.id.asc()).limit(limit + 1)).all()
+        more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        has_newer, has_older = more, True
+    else:
+        if before is not None:
+            query = query.where(Submission.id < before)
+        rows = session.exec(query.order_by(Submission.id.desc()).limit(limit + 1)).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        has_newer, has_older = before is not None, more
+
+    submissions = []
+    for row in rows:
+        hidden = _hidden(row.user_id, row.updated_at, viewer_id, frozen_at)
+        submissions.append({
+            'id': row.id,
+            'problem_id': row.problem_id,
+            'user_id': row.user_id,
+            'language': row.language,
+            'status': "frozen" if hidden else row.status,
+            'score': None if hidden else row.score,
+            'max_score': row.max_score,
+            'passed_tests': None if hidden else row.passed_tests,
+            'total_tests': row.total_tests,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'problem_title': row.title,
+            'current_display_name': row.display_name,
+        })
+    return {
+        "submissions": submissions,
+        "newer": submissions[0]['id'] if submissions and has_newer else None,
+        "older": submissions[-1]['id'] if submissions and has_older else None,
+    }
+
+def _validate_filters(status: str, language: str):
+    if status and status not in SUBMISSION_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(SUBMISSION_STATUSES)}")
+    if language and language not in compile_cache.COMPILE_COMMANDS:
+        raise HTTPException(status_code=400, detail=f"language must be one of {', '.join(compile_cache.COMPILE_COMMANDS)}")
+
 @router.get("/", response_class=HTMLResponse)
-def list_submissions(request: Request, current_user: User = Depends(get_current_user)):
+def list_submissions(
+    request: Request,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+    problem_id: str = "",
+    user_id: str = "",
+    status: str = "",
+    language: str = "",
+    current_user: User = Depends(get_current_user)
+):
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
+    _validate_filters(status, language)
     
+    # ฟอร์ม filter ส่งค่าว่างมาเมื่อเลือก "All"
+    filters = {
+        "problem_id": int(problem_id) if problem_id.isdigit() else None,
+        "user_id": int(user_id) if user_id.isdigit() else None,
+        "status": status,
+        "language": language,
+    }
     with Session(engine) as session:
-        # Join กับ Problem และ User เพื่อดึงชื่อ problem และชื่อ user ปัจจุบัน
-        subs = session.exec(
-            select(Submission, Problem.title, User.display_name)
-            .join(Problem, Submission.problem_id == Problem.id)
-            .join(User, Submission.user_id == User.id)
-            .order_by(Submission.id.desc())
-        ).all()
-        
-        # แปลงเป็น list ของ dictionaries
-        submissions_with_titles = []
-        for sub, title, current_display_name in subs:
-            sub_dict = sub.__dict__.copy()
-            sub_dict['problem_title'] = title
-            sub_dict['current_display_name'] = current_display_name
-            submissions_with_titles.append(sub_dict)
+        page = _list_page(session, before, after, limit, **filters,
+                          viewer_id=current_user.id, frozen_at=_frozen_since(current_user))
+        # ตัวเลือกของ filter (ขนาดตามจำนวนโจทย์/ผู้ใช้ ไม่ใช่จำนวน submission)
+        problems = session.exec(select(Problem.id, Problem.title).order_by(Problem.id)).all()
+        users = session.exec(select(User.id, User.display_name).order_by(User.display_name)).all()
     
+    # query string ของ filter ปัจจุบัน ใช้ต่อท้ายลิงก์เปลี่ยนหน้า
+    filter_query = urlencode({k: v for k, v in filters.items() if v})
     return templates.TemplateResponse("submissions.html", {
         "request": request, 
-        "submissions": submissions_with_titles,
+        "submissions": page["submissions"],
+        "newer": page["newer"],
+        "older": page["older"],
+        "filters": filters,
+        "filter_query": filter_query,
+        "problems": problems,
+        "users": users,
+        "statuses": SUBMISSION_STATUSES,
+        "languages": list(compile_cache.COMPILE_COMMANDS),
         "user": current_user
     })
 
+@router.get("/api")
+def list_submissions_json(
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+    problem_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    status: str = "",
+    language: str = "",
+    current_user: User = Depends(get_current_user)
+):
+    """JSON variant of the submissions list; pass `older` back as `before` for the next page."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    _validate_filters(status, language)
+    
+    with Session(engine) as session:
+        page = _list_page(session, before, after, limit, problem_id=problem_id, user_id=user_id,
+                          status=status, language=language,
+                          viewer_id=current_user.id, frozen_at=_frozen_since(current_user))
+    return JSONResponse(page)
+
 @router.get("/my", response_class=HTMLResponse)
-def my_submissions(request: Request, current_user: User = Depends(get_current_user)):
+def my_submissions(
+    request: Request,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
     
     with Session(engine) as session:
-        # Join กับ Problem เพื่อดึงชื่อ problem
-        subs = session.exec(
-            select(Submission, Problem.title)
-            .join(Problem, Submission.problem_id == Problem.id)
-            .where(Submission.user_id == current_user.id)
-            .order_by(Submission.id.desc())
-        ).all()
-        
-        # แปลงเป็น list ของ dictionaries
-        submissions_with_titles = []
-        for sub, title in subs:
-            sub_dict = sub.__dict__.copy()
-            sub_dict['problem_title'] = title
-            submissions_with_titles.append(sub_dict)
+        page = _list_page(session, before, after, user_id=current_user.id)
     
     return templates.TemplateResponse("my_submissions.html", {
         "request": request, 
-        "submissions": submissions_with_titles,
+        "submissions": page["submissions"],
+        "newer": page["newer"],
+        "older": page["older"],
         "user": current_user
     })
 
+@router.get("/events")
+async def submission_events(request: Request, ids: str = "", current_user: User = Depends(get_current_user)):
+    """Server-Sent Events stream of status changes (and per-test results) for the given submission ids.
+
+    The current status of every id is sent first, so a verdict that landed
+    between rendering the page and opening the stream is not missed.
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    wanted = {int(x) for x in ids.split(",") if x.strip().isdigit()}
+    if not wanted or len(wanted) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"ids must list 1 to {MAX_PAGE_SIZE} submission ids")
+    
+    # subscribe ก่อนอ่านสถานะปัจจุบัน เพื่อไม่ให้พลาด event ที่เกิดระหว่างนั้น
+    subscription = events.subscribe(wanted, current_user.id, current_user.is_admin)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Submission.id, Submission.user_id, Submission.status, Submission.score, Submission.max_score,
+                   Submission.passed_tests, Submission.total_tests, Submission.updated_at)
+            .where(Submission.id.in_(wanted))
+        ).all()
+    # ผลของคนอื่นระหว่าง freeze ไม่ถูกส่ง (event ใหม่ก็ถูกกรองใน Subscription.wants)
+    frozen_at = _frozen_since(current_user)
+    rows = [row for row in rows if not _hidden(row.user_id, row.updated_at, current_user.id, frozen_at)]
+    
+    async def stream():
+        try:
+            for row in rows:
+                yield events.format_sse({
+                    "type": "status", "submission_id": row.id, "user_id": row.user_id, "status": row.status,
+                    "score": row.score, "max_score": row.max_score,
+                    "passed_tests": row.passed_tests, "total_tests": row.total_tests,
+                })
+            while not await request.is_disconnected():
+                event = await subscription.next_event()
+                yield events.format_sse(event) if event else ": keep-alive\n\n"
+        finally:
+            events.unsubscribe(subscription)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/judge/workers")
+def judge_workers(current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view judge workers")
+    
+    return JSONResponse({
+        "workers": get_worker_states(),
+        "compile_cache": compile_cache.stats(DATA_DIR / compile_cache.CACHE_SUBDIR),
+        "event_subscribers": events.subscriber_count(),
+        "fragment_cache": cache.stats(),
+        "scheduler": dispatch.stats(),
+    })
+
+def _batch_progress(session: Session, batch: RejudgeBatch) -> dict:
+    """Counts of a rejudge batch's submissions by status (one indexed GROUP BY)."""
+    counts = dict(session.exec(
+        select(Submission.status, func.count(Submission.id))
+        .where(Submission.rejudge_batch_id == batch.id)
+        .group_by(Submission.status)
+    ).all())
+    queued, running = counts.pop("queued", 0), counts.pop("running", 0)
+    return {
+        "id": batch.id,
+        "problem_id": batch.problem_id,
+        "user_id": batch.user_id,
+        "status_filter": batch.status_filter,
+        "testcase_version": batch.testcase_version,
+        "created_at": batch.created_at.isoformat(),
+        "total": batch.total,
+        "distinct_sources": batch.distinct_sources,
+        "queued": queued,
+        "running": running,
+        "done": sum(counts.values()),
+        "verdicts": counts,
+        "finished": queued + running == 0,
+    }
+
+@router.post("/rejudge")
+def create_rejudge(
+    problem_id: str = Form(""),
+    user_id: str = Form(""),
+    status: str = Form(""),
+    testcase_version: str = Form(""),
+    all_submissions: str = Form(""),
+    current_user: User = Depends(get_current_user)
+):
+    """Requeue every judged submission matching the filters in the low-priority rejudge class."""
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can rejudge submissions")
+    _validate_filters(status, "")
+    
+    pid = int(problem_id) if problem_id.isdigit() else None
+    uid = int(user_id) if user_id.isdigit() else None
+    # กันการกดผิดแล้ว rejudge ทั้งระบบ: ต้องมี filter หรือระบุ all_submissions=1
+    if not (pid or uid or status) and all_submissions != "1":
+        raise HTTPException(status_code=400, detail="Give problem_id, user_id or status (or all_submissions=1 to rejudge everything)")
+    
+    version = None
+    if testcase_version.strip():
+        if not pid:
+            raise HTTPException(status_code=400, detail="testcase_version needs problem_id")
+        versions = testcases.list_versions(DATA_DIR / "problems" / str(pid))
+        if not testcase_version.strip().isdigit() or int(testcase_version) not in versions:
+            raise HTTPException(status_code=400, detail=f"testcase_version must be one of {versions}")
+        version = int(testcase_version)
+    
+    # submission ที่ยังรอ/กำลังตรวจอยู่จะได้ผลใหม่อยู่แล้ว ไม่ต้องรวมเข้า batch
+    conditions = [Submission.status.not_in(("queued", "running"))]
+    if pid:
+        conditions.append(Submission.problem_id == pid)
+    if uid:
+        conditions.append(Submission.user_id == uid)
+    if status:
+        conditions.append(Submission.status == status)
+    
+    with Session(engine) as session:
+        batch = RejudgeBatch(created_by=current_user.id, problem_id=pid, user_id=uid,
+                             status_filter=status or None, testcase_version=version)
+        session.add(batch)
+        session.flush()
+        # score เดิมยังอยู่จนกว่าผลใหม่จะออก bestscore/scoreboard จึงไม่ตกลงระหว่างที่ batch กำลังตรวจ
+        session.execute(
+            update(Submission).where(*conditions).values(
+                status="queued", passed_tests=0, exec_time_ms=None, memory_used_kb=None,
+                test_results=None, testcase_version=version, rejudge_batch_id=batch.id,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        rows = session.exec(
+            select(Submission.id, Submission.user_id, Submission.language, Submission.source_path)
+            .where(Submission.rejudge_batch_id == batch.id, Submission.status == "queued")
+            .order_by(Submission.id)
+        ).all()
+        # source ที่เหมือนกันถูกคอมไพล์ครั้งเดียว (compile cache ใช้ hash ของ source เป็น key)
+        keys = set()
+        for row in rows:
+            try:
+                keys.add(compile_cache.cache_key(row.language, Path(row.source_path).read_bytes()))
+            except (OSError, KeyError):
+                keys.add(("missing", row.id))
+        batch.total = len(rows)
+        batch.distinct_sources = len(keys)
+        session.add(batch)
+        session.commit()
+        session.refresh(batch)
+        progress = _batch_progress(session, batch)
+    
+    for row in rows:
+        dispatch.notify(row.id, dispatch.PRIORITY_REJUDGE, row.user_id)
+        events.publish({"type": "status", "submission_id": row.id, "user_id": row.user_id, "status": "queued"})
+    return JSONResponse(progress)
+
+@router.get("/rejudge")
+def list_rejudges(limit: int = 20, current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view rejudges")
+    
+    with Session(engine) as session:
+        batches = session.exec(
+            select(RejudgeBatch).order_by(RejudgeBatch.id.desc()).limit(max(1, min(limit, MAX_PAGE_SIZE)))
+        ).all()
+        return JSONResponse({"batches": [_batch_progress(session, batch) for batch in batches]})
+
+@router.get("/rejudge/{batch_id}")
+def rejudge_progress(batch_id: int, current_user: User = Depends(get_current_user)):
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view rejudges")
+    
+    with Session(engine) as session:
+        batch = session.get(RejudgeBatch, batch_id)
+        if not batch:
+            raise HTTPException(status_code=404, detail="Rejudge batch not found")
+        return JSONResponse(_batch_progress(session, batch))
+
 @router.get("/{submission_id}", response_class=HTMLResponse)
 def submission_detail(request: Request, submission_id: int, current_user: User = Depends(get_current_user)):
     if not current_user:
@@ -90,17 +395,25 @@ def submission_detail(request: Request, submission_id: int, current_user: User =
         except Exception as e:
             source_code = f"Error reading source code: {str(e)}"
     
+    test_results = json.loads(submission.test_results) if submission.test_results else []
+    if not current_user.is_admin:
+        # detail ของเทสต์ที่ไม่ผ่านมีส่วนต้นของ expected output อยู่ เจ้าของเห็นแค่ verdict/เวลา/memory
+        test_results = [{k: v for k, v in t.items() if k != "detail"} for t in test_results]
+    
     return templates.TemplateResponse("submission_detail.html", {
         "request": request, 
         "submission": submission,
         "source_code": source_code,
-        "user": current_user
+        "test_results": test_results,
+        "user": current_user,
+        "testcase_versions": testcases.list_versions(DATA_DIR / "problems" / str(submission.problem_id)) if current_user.is_admin else []
     })
 
 @router.post("/{submission_id}/rerun")
 async def rerun_submission(
     request: Request,
     submission_id: int,
+    testcase_version: str = Form(""),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user or not current_user.is_admin:
@@ -111,18 +424,35 @@ async def rerun_submission(
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
     
+    # ว่าง = ตรวจกับชุด testcase ปัจจุบันของโจทย์ ณ ตอนที่ judge หยิบไปตรวจ
+    version = None
+    if testcase_version.strip():
+        versions = testcases.list_versions(DATA_DIR / "problems" / str(submission.problem_id))
+        if not testcase_version.strip().isdigit() or int(testcase_version) not in versions:
+            raise HTTPException(status_code=400, detail=f"testcase_version must be one of {versions}")
+        version = int(testcase_version)
+    
     # รีเซ็ตสถานะ submission
     with Session(engine) as session:
         submission = session.get(Submission, submission_id)
         submission.status = "queued"
-        submission.score = 0
-        submission.tests_passed = 0
-        submission.execution_time_ms = 0
+        # score เดิมยังนับใน bestscore จนกว่าผลใหม่จะออก
+        submission.passed_tests = 0
+        submission.exec_time_ms = None
+        submission.memory_used_kb = None
+        submission.test_results = None
+        submission.testcase_version = version
+        # rerun ทีละอันถูกตรวจในคิวปกติ และไม่นับเป็นส่วนของ rejudge batch อีก
+        submission.rejudge_batch_id = None
+        submission.updated_at = datetime.utcnow()
         session.add(submission)
+        # อ่านก่อน commit: หลัง commit object ถูก expire และใช้นอก session ไม่ได้
+        owner_id = submission.user_id
         session.commit()
     
-    # ส่งไปยัง judge queue (จะต้องมีระบบ queue จริง)
-    # สำหรับตอนนี้แค่เปลี่ยนสถานะเป็น queued
+    # ส่งไปยัง judge queue
+    dispatch.notify(submission_id, dispatch.PRIORITY_LIVE, owner_id)
+    events.publish({"type": "status", "submission_id": submission_id, "user_id": owner_id, "status": "queued"})
     
     return RedirectResponse(url=f"/submissions/{submission_id}", status_code=303)
 
@@ -146,6 +476,11 @@ async def submit(
         if not problem:
             return HTMLResponse("Problem not found", status_code=404)
         
+        # submission แรกของ user ในโจทย์นี้ได้ตรวจก่อน (ใช้ index (user_id, problem_id))
+        first = session.exec(
+            select(Submission.id).where(Submission.user_id == current_user.id, Submission.problem_id == problem_id).limit(1)
+        ).first() is None
+        
         sub = Submission(
             problem_id=problem_id, 
             user_id=current_user.id,
@@ -168,5 +503,9 @@ async def submit(
         sub.source_path = str(dest)
         session.add(sub)
         session.commit()
+        sub_id = sub.id
+    
+    # ปลุก judge worker ทันทีหลังไฟล์ source ถูกเขียนเรียบร้อยแล้ว
+    dispatch.notify(sub_id, dispatch.PRIORITY_FIRST if first else dispatch.PRIORITY_LIVE, current_user.id)
     
     return RedirectResponse(url="/submissions/", status_code=303)
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""In-memory contest scoreboard built from the bestscore table.
+
+Standings are kept as a sorted list of rank keys, so the rank of one user
+is a bisect and the top K a slice instead of an aggregate over every
+cell. The judge refreshes a single user's row after each verdict. An
+admin can freeze the board: participants then see the snapshot taken at
+that moment (saved under data/ so it survives a restart) while admins
+keep seeing the live standings.
+"""
+import bisect
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from sqlmodel import Session, select
+
+from app import cache
+from app.db import engine
+from app.models import User, BestScore
+
+FREEZE_PATH = Path(__file__).resolve().parents[1] / "data" / "scoreboard_freeze.json"
+
+_lock = threading.Lock()
+# query + แก้ board ของ user เดียวกันต้องเรียงกัน ไม่งั้นผลที่อ่านก่อนอาจทับผลที่ใหม่กว่า
+_refresh_lock = threading.Lock()
+_live = None
+_frozen = None
+_frozen_at = None
+_loaded = False
+
+class Board:
+    """Standings ordered by score, then problems solved, then who reached their score first."""
+
+    def __init__(self):
+        self.entries = {}
+        self.keys = []
+
+    @staticmethod
+    def _key(stat: dict) -> tuple:
+        return (-stat['total_score'], -stat['problems_solved'], stat['last_improved'], stat['id'])
+
+    def put(self, stat: dict):
+        self.remove(stat['id'])
+        self.entries[stat['id']] = stat
+        bisect.insort(self.keys, self._key(stat))
+
+    def remove(self, user_id: int):
+        stat = self.entries.pop(user_id, None)
+        if stat is not None:
+            del self.keys[bisect.bisect_left(self.keys, self._key(stat))]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        stat = self.entries.get(user_id)
+        if stat is None:
+            return None
+        return bisect.bisect_left(self.keys, self._key(stat)) + 1
+
+    def top(self, k: Optional[int] = None) -> List[dict]:
+        return [self.entries[key[-1]] for key in self.keys[:k]]
+
+def _stat(user_id: int, display_name: str, cells) -> dict:
+    # คะแนนบางส่วนนับด้วย แต่นับแค่คะแนนที่ดีที่สุดของแต่ละโจทย์
+    stat = {
+        'id': user_id,
+        'display_name': display_name,
+        'total_score': 0,
+        'problems_solved': 0,
+        'total_submissions': 0,
+        'solved_problems': [],
+        'last_improved': min(cell.improved_at for cell in cells),
+    }
+    improved = []
+    for cell in cells:
+        stat['total_score'] += cell.best_score
+        stat['total_submissions'] += cell.attempts
+        if cell.max_score and cell.best_score >= cell.max_score:
+            stat['problems_solved'] += 1
+        if cell.best_score > 0:
+            stat['solved_problems'].append({
+                'problem_id': cell.problem_id,
+                'score': cell.best_score,
+                'max_score': cell.max_score,
+            })
+            improved.append(cell.improved_at)
+    if improved:
+        stat['last_improved'] = max(improved)
+    return stat
+
+def _cells_query():
+    return (
+        select(User.id, User.display_name, BestScore.problem_id, BestScore.best_score,
+               BestScore.max_score, BestScore.attempts, BestScore.improved_at)
+        .join(BestScore, User.id == BestScore.user_id)
+        .where(User.is_admin == False)
+        .order_by(User.id, BestScore.problem_id)
+    )
+
+def _load_frozen():
+    if not FREEZE_PATH.exists():
+        return None, None
+    data = json.loads(FREEZE_PATH.read_text())
+    board = Board()
+    for stat in data["standings"]:
+        stat['last_improved'] = datetime.fromisoformat(stat['last_improved'])
+        board.put(stat)
+    return board, datetime.fromisoformat(data["frozen_at"])
+
+def _ensure_loaded():
+    """Build the live board from bestscore once (one query over users x attempted problems)."""
+    global _live, _frozen, _frozen_at, _loaded
+    if _loaded:
+        return
+    with _refresh_lock:
+        if _loaded:
+            return
+        with Session(engine) as session:
+            cells = session.exec(_cells_query()).all()
+        by_user = {}
+        for cell in cells:
+            by_user.setdefault((cell.id, cell.display_name), []).append(cell)
+        board = Board()
+        for (user_id, display_name), user_cells in by_user.items():
+            board.put(_stat(user_id, display_name, user_cells))
+        frozen, frozen_at = _load_frozen()
+        with _lock:
+            _live, _frozen, _frozen_at = board, frozen, frozen_at
+            _loaded = True
+
+def refresh_user(user_id: int):
+    """Re-read one user's cells after a verdict or a name change and move their row."""
+    if not _loaded:
+        return  # โหลดครั้งแรกจะอ่านค่าล่าสุดเอง
+    with _refresh_lock:
+        with Session(engine) as session:
+            cells = session.exec(_cells_query().where(User.id == user_id)).all()
+        with _lock:
+            if cells:
+                _live.put(_stat(user_id, cells[0].display_name, cells))
+            else:
+                _live.remove(user_id)
+
+def _board(live: bool) -> Board:
+    return _live if live or _frozen is None else _frozen
+
+def standings(live: bool = False) -> List[dict]:
+    """Ordered rows; the frozen snapshot unless live is set (admins) or the board is not frozen."""
+    _ensure_loaded()
+    with _lock:
+        return _board(live).top()
+
+def top(k: int, live: bool = False) -> List[dict]:
+    _ensure_loaded()
+    with _lock:
+        return _board(live).top(k)
+
+def rank(user_id: int, live: bool = False) -> Optional[int]:
+    _ensure_loaded()
+    with _lock:
+        return _board(live).rank(user_id)
+
+def entry(user_id: int, live: bool = False) -> Optional[dict]:
+    _ensure_loaded()
+    with _lock:
+        return _board(live).entries.get(user_id)
+
+def frozen_at() -> Optional[datetime]:
+    _ensure_loaded()
+    return _frozen_at
+
+def freeze() -> datetime:
+    """Snapshot the live standings; participants see this snapshot until unfreeze()."""
+    global _frozen, _frozen_at
+    _ensure_loaded()
+    with _lock:
+        snapshot = copy.deepcopy(_live)
+        at = datetime.utcnow()
+    data = {
+        "frozen_at": at.isoformat(),
+        "standings": [dict(stat, last_improved=stat['last_improved'].isoformat()) for stat in snapshot.top()],
+    }
+    FREEZE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = FREEZE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, FREEZE_PATH)
+    with _lock:
+        _frozen, _frozen_at = snapshot, at
+    cache.bump("scoreboard")
+    return at
+
+def unfreeze():
+    global _frozen, _frozen_at
+    _ensure_loaded()
+    FREEZE_PATH.unlink(missing_ok=True)
+    with _lock:
+        _frozen, _frozen_at = None, None
+    cache.bump("scoreboard")
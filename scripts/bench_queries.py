@@ -0,0 +1,148 @@
+"""Benchmark the hot submission queries against a seeded database.
+
+Seeds a throwaway SQLite database with N submissions, then times each
+query with the migration indexes in place and again with them dropped.
+
+    python scripts/bench_queries.py --submissions 300000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+STATUSES = ["accepted", "wrong_answer", "time_limit", "runtime_error", "compile_error"]
+
+# (ชื่อ, SQL, parameters) ตามเส้นทางที่ถูกเรียกบ่อยในแอป
+QUERIES = [
+    ("judge: queued scan", "SELECT id FROM submission WHERE status = 'queued' ORDER BY id", ()),
+    # "judge: best score refresh" ถูกเพิ่มจาก runner ใน main() (ดู best_score_refresh)
+    ("my submissions (latest 50)",
+     "SELECT * FROM submission WHERE user_id = ? ORDER BY id DESC LIMIT 50", (7,)),
+    ("problem submissions (latest 50)",
+     "SELECT * FROM submission WHERE problem_id = ? ORDER BY id DESC LIMIT 50", (3,)),
+    ("login: user by username", "SELECT * FROM user WHERE username = ?", ("user07",)),
+    ("problem list with best score",
+     "SELECT problem.*, bestscore.best_score FROM problem LEFT OUTER JOIN bestscore "
+     "ON bestscore.problem_id = problem.id AND bestscore.user_id = ? ORDER BY problem.id DESC", (7,)),
+    ("leaderboard", "SELECT user.id, user.display_name, bestscore.* FROM user JOIN bestscore "
+     "ON user.id = bestscore.user_id WHERE user.is_admin = 0 ORDER BY user.id, bestscore.problem_id", ()),
+]
+
+# index ที่ migration สร้างไว้สำหรับ query ข้างบน (ไม่รวม UNIQUE constraint ซึ่ง drop ไม่ได้)
+MIGRATION_INDEXES = [
+    "ix_submission_status_id",
+    "ix_submission_user_id",
+    "ix_submission_problem_id",
+    "ix_submission_user_problem",
+]
+
+def seed(db_path: str, submissions: int, users: int, problems: int):
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow()
+    conn.executemany(
+        "INSERT INTO user (id, username, password_hash, display_name, name_changes_left, is_admin, created_at) "
+        "VALUES (?, ?, '', ?, 2, 0, ?)",
+        [(i, f"user{i:02d}", f"user{i:02d}", now) for i in range(1, users + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO problem (id, title, slug, time_limit_ms, memory_limit_mb, max_score, testcase_count, checker, created_at) "
+        "VALUES (?, ?, ?, 1000, 256, 100, 10, 'exact', ?)",
+        [(i, f"P{i}", f"p{i}", now) for i in range(1, problems + 1)],
+    )
+    rng = random.Random(1)
+    batch = []
+    for i in range(1, submissions + 1):
+        user_id = rng.randint(1, users)
+        status = "queued" if i > submissions - 20 else rng.choice(STATUSES)
+        score = 100 if status == "accepted" else rng.choice([0, 0, 30, 50])
+        at = now - timedelta(seconds=submissions - i)
+        batch.append((rng.randint(1, problems), user_id, f"user{user_id:02d}", status, score, at, at))
+        if len(batch) == 10000:
+            _insert_submissions(conn, batch)
+            batch = []
+    if batch:
+        _insert_submissions(conn, batch)
+    conn.execute("""
+    INSERT INTO bestscore (user_id, problem_id, best_score, max_score, attempts, improved_at)
+    SELECT user_id, problem_id, MAX(score), MAX(max_score), COUNT(*), MAX(updated_at)
+    FROM submission WHERE status NOT IN ('queued', 'running') GROUP BY user_id, problem_id
+    """)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def _insert_submissions(conn, batch):
+    conn.executemany(
+        "INSERT INTO submission (problem_id, user_id, user_name, language, source_path, status, score, max_score, "
+        "passed_tests, total_tests, created_at, updated_at) VALUES (?, ?, ?, 'cpp', '', ?, ?, 100, 0, 10, ?, ?)",
+        batch,
+    )
+
+def best_score_refresh() -> tuple:
+    """The judge's bestscore query compiled from app.judge.runner, so the benchmark cannot drift from it."""
+    from sqlalchemy.dialects import sqlite
+    from app.judge.runner import _best_score_query
+
+    compiled = _best_score_query(7, 3).compile(dialect=sqlite.dialect(), compile_kwargs={"render_postcompile": True})
+    return "judge: best score refresh", str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)
+
+def time_queries(db_path: str, queries: list, repeat: int) -> dict:
+    conn = sqlite3.connect(db_path)
+    results = {}
+    for name, sql, params in queries:
+        conn.execute(sql, params).fetchall()  # warm up page cache
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        results[name + " plan"] = "; ".join(row[-1] for row in plan)
+    conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=300000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--problems", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmp.name, "bench.db")
+    os.environ["GRADER_DB_PATH"] = db_path
+    sys.path.insert(0, str(ROOT))
+    from app.db import init_db
+
+    init_db()
+    queries = QUERIES[:1] + [best_score_refresh()] + QUERIES[1:]
+    started = time.perf_counter()
+    seed(db_path, args.submissions, args.users, args.problems)
+    print(f"seeded {args.submissions} submissions in {time.perf_counter() - started:.1f}s")
+
+    indexed = time_queries(db_path, queries, args.repeat)
+    conn = sqlite3.connect(db_path)
+    for name in MIGRATION_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    unindexed = time_queries(db_path, queries, args.repeat)
+
+    print(f"{'query':<34}{'no index (ms)':>15}{'indexed (ms)':>15}")
+    for name, _, _ in queries:
+        print(f"{name:<34}{unindexed[name]:>15.3f}{indexed[name]:>15.3f}")
+    print()
+    for name, _, _ in queries:
+        print(f"{name}: {indexed[name + ' plan']}")
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Concurrent read/write load test for the SQLite settings in app/db.py.
+
+Reader processes run the submission-list queries while writer processes
+commit verdicts through the judge's own update path (separate processes,
+so the numbers show database lock waits rather than GIL contention). Run
+it once per journal mode to compare reader latency and lock errors:
+
+    python scripts/load_db.py --journal WAL
+    python scripts/load_db.py --journal DELETE
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def _setup(db_path: str, journal: str):
+    # ต้องตั้งก่อน import app.db
+    os.environ["GRADER_DB_PATH"] = db_path
+    os.environ["GRADER_SQLITE_JOURNAL"] = journal
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "scripts"))
+
+def _reader(db_path, journal, seed_value, deadline, results):
+    _setup(db_path, journal)
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import Submission, UserStats
+
+    rng = random.Random(seed_value)
+    latencies, errors = [], []
+    while time.time() < deadline:
+        user_id = rng.randint(1, 100)
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.exec(
+                    select(Submission).where(Submission.user_id == user_id)
+                    .order_by(Submission.id.desc()).limit(50)
+                ).all()
+                session.exec(select(UserStats).where(UserStats.user_id == user_id)).first()
+        except Exception as e:
+            errors.append(f"read: {e}")
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    results.put(("read", latencies, errors))
+
+def _writer(db_path, journal, seed_value, deadline, submissions, results):
+    _setup(db_path, journal)
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Submission
+    from app.judge.runner import _update_best_score, _update_user_stats
+
+    # เส้นทางเดียวกับที่ judge ใช้บันทึก verdict
+    rng = random.Random(seed_value)
+    latencies, errors = [], []
+    while time.time() < deadline:
+        sub_id = rng.randint(1, submissions - 20)
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                sub = session.get(Submission, sub_id)
+                sub.score = rng.choice([0, 50, 100])
+                sub.status = "accepted" if sub.score == 100 else "wrong_answer"
+                session.add(sub)
+                session.flush()
+                delta = _update_best_score(session, sub.user_id, sub.problem_id)
+                _update_user_stats(session, sub.user_id, delta, sub.updated_at)
+                session.commit()
+        except Exception as e:
+            errors.append(f"write: {e}")
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    results.put(("write", latencies, errors))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journal", default="WAL", help="WAL or DELETE")
+    parser.add_argument("--submissions", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmp.name, "load.db")
+    _setup(db_path, args.journal)
+    from app.db import init_db, engine
+    from bench_queries import seed
+
+    init_db()
+    seed(db_path, args.submissions, users=100, problems=50)
+    with engine.connect() as conn:
+        mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+    print(f"journal_mode={mode}, {args.readers} readers, {args.writers} writers, {args.seconds}s")
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    procs = [multiprocessing.Process(target=_reader, args=(db_path, args.journal, i, deadline, results))
+             for i in range(args.readers)]
+    procs += [multiprocessing.Process(target=_writer, args=(db_path, args.journal, 1000 + i, deadline, args.submissions, results))
+              for i in range(args.writers)]
+    for p in procs:
+        p.start()
+    collected = {"read": [], "write": []}
+    errors = []
+    for _ in procs:
+        role, latencies, errs = results.get()
+        collected[role].extend(latencies)
+        errors.extend(errs)
+    for p in procs:
+        p.join()
+
+    for name, values in collected.items():
+        print(f"{name:>5}: {len(values) / args.seconds:8.1f}/s  p50 {percentile(values, 0.5):7.2f} ms  "
+              f"p99 {percentile(values, 0.99):7.2f} ms  max {max(values or [0]):7.2f} ms")
+    print(f"errors: {len(errors)}")
+    for message in sorted(set(errors))[:5]:
+        print("  ", message)
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Simultaneous-login burst against a running grader.
+
+Every predefined account logs in at the same instant (like the start of
+a contest) while another client keeps loading a light page, and the
+latency of both is reported:
+
+    uvicorn app.main:app --port 8000
+    python scripts/load_login.py --url http://127.0.0.1:8000 --users 50
+"""
+import argparse
+import http.client
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def request(url: str, method: str, path: str, body: str = None):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+    headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+    started = time.perf_counter()
+    conn.request(method, path, body=body, headers=headers)
+    status = conn.getresponse().status
+    conn.close()
+    return status, (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    from app.auth import PREDEFINED_USERS
+
+    accounts = list(PREDEFINED_USERS.items())[:args.users]
+    barrier = threading.Barrier(len(accounts) + 1)
+    done = threading.Event()
+    logins, pages = [], []
+    lock = threading.Lock()
+
+    def login(username, data):
+        barrier.wait()
+        status, ms = request(args.url, "POST", "/auth/login",
+                             urlencode({"username": username, "password": data["password"]}))
+        with lock:
+            logins.append((status, ms))
+
+    def browse():
+        # request อื่นที่ไม่เกี่ยวกับ login ไม่ควรช้าลงระหว่างที่ทุกคน login
+        barrier.wait()
+        while not done.is_set():
+            status, ms = request(args.url, "GET", "/auth/login")
+            with lock:
+                pages.append((status, ms))
+
+    threads = [threading.Thread(target=login, args=account) for account in accounts]
+    browser = threading.Thread(target=browse)
+    for t in threads + [browser]:
+        t.start()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    browser.join()
+
+    ok = sum(1 for status, _ in logins if status == 303)
+    print(f"{len(logins)} logins in {elapsed:.2f}s ({ok} ok, {len(logins) - ok} failed/busy)")
+    for name, samples in (("login", logins), ("page", pages)):
+        values = [ms for _, ms in samples]
+        print(f"{name:>5}: n={len(values):<5} p50 {percentile(values, 0.5):8.1f} ms  "
+              f"p99 {percentile(values, 0.99):8.1f} ms  max {max(values or [0]):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import io
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+# ต้องตั้งก่อน import app: ฐานข้อมูลและจำนวน worker ถูกอ่านตอน import
+TEST_ROOT = Path(tempfile.mkdtemp(prefix="grader-tests-"))
+os.environ.setdefault("GRADER_DB_PATH", str(TEST_ROOT / "test.db"))
+os.environ.setdefault("GRADER_JUDGE_WORKERS", "1")
+
+PDF = (b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj 2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj "
+       b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 3 3]>>endobj\nxref\n0 4\n0000000000 65535 f \n"
+       b"0000000009 00000 n \n0000000052 00000 n \n0000000101 00000 n \ntrailer<</Size 4/Root 1 0 R>>\n"
+       b"startxref\n160\n%%EOF\n")
+
+def make_testcase_zip(count: int = 3) -> bytes:
+    """inputN.txt "N N" / outputN.txt "2N" for N = 1..count."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        for i in range(1, count + 1):
+            z.writestr(f"input{i}.txt", f"{i} {i}\n")
+            z.writestr(f"output{i}.txt", f"{2 * i}\n")
+    return buffer.getvalue()
+
+@pytest.fixture(scope="session")
+def app_client():
+    """Admin client of the full app with its data directory and judge worker under a temp dir."""
+    from fastapi.testclient import TestClient
+    from app import main, scoreboard
+    from app.routers import problems, submissions
+
+    data = TEST_ROOT / "data"
+    for sub in ("problems", "submissions", "pdfs"):
+        (data / sub).mkdir(parents=True, exist_ok=True)
+    main.DATA_DIR = problems.DATA_DIR = submissions.DATA_DIR = data
+    problems.UPLOAD_DIR = data / "uploads"
+    scoreboard.FREEZE_PATH = data / "scoreboard_freeze.json"
+
+    with TestClient(main.app) as client:
+        r = client.post("/auth/login", data={"username": "yee", "password": "yee"}, follow_redirects=False)
+        assert r.status_code == 303
+        yield client
+
+def wait_judged(submission_id: int, timeout: float = 60):
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Submission
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with Session(engine) as session:
+            sub = session.get(Submission, submission_id)
+            if sub.status not in ("queued", "running"):
+                return sub
+        time.sleep(0.05)
+    raise AssertionError(f"submission {submission_id} still {sub.status} after {timeout}s")
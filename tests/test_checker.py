@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+from app.judge import checker
+
+def check(got: bytes, want: bytes, mode: str = "exact", **kwargs):
+    return checker.check(io.BytesIO(got), io.BytesIO(want), mode, **kwargs)
+
+@pytest.fixture(params=[checker.CHUNK_SIZE, 1, 3])
+def chunk_size(request, monkeypatch):
+    # ผลต้องไม่ขึ้นกับว่าบรรทัด/token ถูกตัดกลาง chunk ตรงไหน
+    monkeypatch.setattr(checker, "CHUNK_SIZE", request.param)
+
+def test_exact_ignores_trailing_whitespace_and_blank_edges(chunk_size):
+    assert check(b"\n1 2  \r\n3\t\n\n\n", b"1 2\n3\n") == (True, "OK")
+
+def test_exact_keeps_inner_blank_lines(chunk_size):
+    assert check(b"1\n\n2\n", b"1\n2\n") == (False, "line 2: expected 2, got ")
+
+def test_exact_leading_whitespace_is_significant(chunk_size):
+    assert check(b" 1\n", b"1\n") == (False, "line 1: expected 1, got  1")
+
+def test_exact_missing_line(chunk_size):
+    assert check(b"1\n", b"1\n2\n") == (False, "line 2: expected 2, got <end of output>")
+
+def test_tokens_ignore_layout(chunk_size):
+    assert check(b"  1\n2    3 ", b"1 2\n3\n", "tokens") == (True, "OK")
+    assert check(b"12 3", b"1 23", "tokens") == (False, "token 1: expected 1, got 12")
+
+def test_float_tolerance(chunk_size):
+    assert check(b"0.3333333 1e6\n", b"0.333333333 1000000.5\n", "float") == (True, "OK")
+    assert check(b"0.334\n", b"0.333\n", "float")[0] is False
+    assert check(b"abc\n", b"abc\n", "float") == (True, "OK")
+
+def test_output_limit():
+    with pytest.raises(checker.OutputLimitExceeded):
+        check(b"1" * 100, b"1", limit=10)
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        check(b"", b"", "regex")
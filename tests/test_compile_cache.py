@@ -0,0 +1,44 @@
+import pytest
+
+from app.judge import compile_cache
+
+SOURCE = b"int main(){}\n"
+
+@pytest.fixture
+def compile_with(monkeypatch, tmp_path):
+    """Run get_executable with a fake compiler: a shell script that gets the usual source/-o/output arguments."""
+    source = tmp_path / "main.c"
+    source.write_bytes(SOURCE)
+    cache_dir = tmp_path / "cache"
+    calls = tmp_path / "calls"
+
+    def compile_(script: str):
+        monkeypatch.setitem(compile_cache.COMPILE_COMMANDS, "c", ["sh", "-c", f"echo >> {calls}; {script}", "cc"])
+        return compile_cache.get_executable(cache_dir, "c", source, tmp_path / "prog")
+
+    compile_.calls = lambda: len(calls.read_text().splitlines())
+    return compile_
+
+def test_compile_error_is_cached(compile_with):
+    assert compile_with("echo 'main.c:1: error: nope'; exit 1") == (False, "main.c:1: error: nope\n", False)
+    assert compile_with("echo 'main.c:1: error: nope'; exit 1") == (False, "main.c:1: error: nope\n", True)
+    assert compile_with.calls() == 1
+
+@pytest.mark.parametrize("script", [
+    "kill -KILL $$",
+    "echo 'cc: fatal error: Killed signal terminated program cc1'; exit 1",
+    "echo 'cc1: out of memory allocating 65536 bytes'; exit 1",
+])
+def test_transient_failure_is_not_cached(compile_with, script):
+    assert compile_with(script)[0] is False
+    assert compile_with(script)[2] is False
+    assert compile_with.calls() == 2
+
+def test_success_is_cached(compile_with, tmp_path):
+    assert compile_with('cp "$1" "$3"') == (True, "", False)
+    assert compile_with('cp "$1" "$3"') == (True, "", True)
+    assert (tmp_path / "prog").read_bytes() == SOURCE
+
+def test_key_locks_are_dropped(compile_with):
+    compile_with("exit 1")
+    assert compile_cache._key_locks == {}
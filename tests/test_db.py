@@ -0,0 +1,21 @@
+import sqlite3
+
+from app import db
+
+def test_migration_8_counts_scores_waiting_for_rejudge():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+    CREATE TABLE submission (id INTEGER PRIMARY KEY, user_id INTEGER, problem_id INTEGER, status TEXT,
+                             score INTEGER, max_score INTEGER, created_at TIMESTAMP);
+    CREATE TABLE bestscore (user_id INTEGER, problem_id INTEGER, best_score INTEGER, max_score INTEGER,
+                            attempts INTEGER, improved_at TIMESTAMP);
+    CREATE TABLE userstats (user_id INTEGER, total_score INTEGER, total_submissions INTEGER, problems_solved INTEGER);
+    -- submission 2 ได้ 100 ไปแล้วและกำลังรอ rejudge
+    INSERT INTO submission VALUES (1, 1, 1, 'wrong_answer', 40, 100, '2026-01-01 10:00:00');
+    INSERT INTO submission VALUES (2, 1, 1, 'queued', 100, 100, '2026-01-01 11:00:00');
+    INSERT INTO bestscore VALUES (1, 1, 40, 100, 1, '2026-01-01 10:00:00');
+    INSERT INTO userstats VALUES (1, 40, 1, 0);
+    """)
+    db._migration_8_waiting_scores_count(conn)
+    assert conn.execute("SELECT best_score, attempts, improved_at FROM bestscore").fetchone() == (100, 1, "2026-01-01 11:00:00")
+    assert conn.execute("SELECT total_score, total_submissions, problems_solved FROM userstats").fetchone() == (100, 1, 1)
@@ -0,0 +1,78 @@
+import importlib
+
+import pytest
+
+from app.judge import dispatch as dispatch_module
+
+@pytest.fixture
+def dispatch(monkeypatch):
+    """A fresh scheduler (module state is global) with the default in-flight limit of 2."""
+    monkeypatch.setenv("GRADER_USER_INFLIGHT", "2")
+    yield importlib.reload(dispatch_module)
+    # ไม่ทิ้งงานค้างหรือ slot ที่ยังไม่คืนไว้ให้ test อื่นที่ใช้ judge จริง
+    monkeypatch.undo()
+    importlib.reload(dispatch_module)
+
+def drain(dispatch):
+    picked = []
+    while True:
+        sub_id = dispatch.next_submission(timeout=0)
+        if sub_id is None:
+            return picked
+        picked.append(sub_id)
+
+def test_duplicate_delivery_releases_every_slot(dispatch):
+    # rerun ระหว่างที่ submission 5 กำลังตรวจ: id เดียวกันถูกหยิบสองครั้ง
+    dispatch.notify(5, dispatch.PRIORITY_LIVE, 1)
+    assert dispatch.next_submission(timeout=0) == 5
+    dispatch.notify(5, dispatch.PRIORITY_LIVE, 1)
+    assert dispatch.next_submission(timeout=0) == 5
+    assert dispatch.stats()["inflight_by_user"] == {1: 2}
+    dispatch.done(5)
+    dispatch.done(5)
+    assert dispatch.stats()["inflight_by_user"] == {}
+
+    # user ยังได้ slot ครบทั้งสองหลังจากนั้น
+    dispatch.notify(6, dispatch.PRIORITY_LIVE, 1)
+    dispatch.notify(7, dispatch.PRIORITY_LIVE, 1)
+    assert drain(dispatch) == [6, 7]
+
+def test_done_without_pick_is_ignored(dispatch):
+    dispatch.done(42)
+    assert dispatch.stats()["inflight_by_user"] == {}
+
+def test_queued_id_is_not_queued_twice(dispatch):
+    dispatch.notify(5, dispatch.PRIORITY_LIVE, 1)
+    dispatch.notify(5, dispatch.PRIORITY_LIVE, 1)
+    assert dispatch.pending_count() == 1
+    assert drain(dispatch) == [5]
+
+def test_rerun_moves_rejudge_entry_up(dispatch):
+    dispatch.notify(5, dispatch.PRIORITY_REJUDGE, 1)
+    dispatch.notify(9, dispatch.PRIORITY_LIVE, 2)
+    dispatch.notify(5, dispatch.PRIORITY_LIVE, 1)
+    assert dispatch.pending_by_priority() == {"first": 0, "live": 2, "rejudge": 0}
+    # ไม่ถอยกลับไป class ที่ต่ำกว่า
+    dispatch.notify(5, dispatch.PRIORITY_REJUDGE, 1)
+    assert dispatch.pending_by_priority()["rejudge"] == 0
+    assert sorted(drain(dispatch)) == [5, 9]
+
+def test_users_take_turns_within_limit(dispatch):
+    for sub_id in (1, 2, 3, 4):
+        dispatch.notify(sub_id, dispatch.PRIORITY_LIVE, 1)
+    dispatch.notify(10, dispatch.PRIORITY_LIVE, 2)
+    dispatch.notify(20, dispatch.PRIORITY_FIRST, 3)
+    # user 1 ได้แค่ 2 slot จนกว่าจะ done()
+    assert drain(dispatch) == [20, 1, 10, 2]
+    dispatch.done(1)
+    assert drain(dispatch) == [3]
+
+def test_retry_requeues_with_the_same_class_and_user(dispatch):
+    dispatch.notify(5, dispatch.PRIORITY_FIRST, 1)
+    assert dispatch.next_submission(timeout=0) == 5
+    # claim ล้มเหลว: worker ใส่ id กลับก่อนคืน slot
+    dispatch.retry(5)
+    dispatch.done(5)
+    assert dispatch.pending_by_priority() == {"first": 1, "live": 0, "rejudge": 0}
+    assert dispatch.next_submission(timeout=0) == 5
+    assert dispatch.stats()["inflight_by_user"] == {1: 1}
@@ -0,0 +1,117 @@
+import io
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from app.judge import checker, executor
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux") or shutil.which("gcc") is None,
+                                reason="needs Linux /proc and gcc")
+
+LIMITS = {"time_limit_ms": 1000, "wall_limit_s": 2.0, "memory_limit_kb": 262144}
+
+SOURCES = {
+    "sum": '#include <stdio.h>\nint main(){int a,b;scanf("%d %d",&a,&b);printf("%d\\n",a+b);}',
+    # ลูกออกจาก process group ด้วย setsid() แล้วถือ stdout ค้างไว้หลังตัวโปรแกรมจบ
+    "escape": '#include <stdio.h>\n#include <unistd.h>\n'
+              'int main(){pid_t p=fork(); if(p==0){setsid(); sleep(30); return 0;}'
+              ' printf("%d\\n",p); fflush(stdout); usleep(100000); return 0;}',
+    # ใช้ memory จริง 100 MB: เกิน limit 32 MB แต่ไม่ถึง RLIMIT_AS
+    "hog": '#include <stdlib.h>\n#include <string.h>\n#include <unistd.h>\n'
+           'int main(){size_t n=100<<20; char *p=malloc(n); if(!p) return 3; memset(p,1,n); sleep(1); return p[n-1];}',
+}
+
+@pytest.fixture(scope="module")
+def programs(tmp_path_factory):
+    root = tmp_path_factory.mktemp("programs")
+    built = {}
+    for name, source in SOURCES.items():
+        (root / f"{name}.c").write_text(source)
+        subprocess.run(["gcc", "-O2", "-o", str(root / name), str(root / f"{name}.c")], check=True)
+        built[name] = root / name
+    return built
+
+def alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+def run(sandbox: executor.Sandbox, expected: bytes, seen=None):
+    def consume(stdout):
+        output = stdout.read()
+        if seen is not None:
+            seen.append(output)
+        return checker.check(io.BytesIO(output), io.BytesIO(expected))
+    return sandbox.run(b"1 1\n", LIMITS, consume)
+
+def test_memory_over_limit_is_caught_by_sampling_not_rlimit(programs, tmp_path):
+    sandbox = executor.Sandbox(tmp_path / "box")
+    sandbox.prepare(programs["hog"])
+    result = sandbox.run(b"", dict(LIMITS, memory_limit_kb=32 * 1024), lambda stdout: (stdout.read() == b"", ""))
+    assert result["killed_for"] == "memory_limit"
+    assert result["memory_kb"] > 32 * 1024
+
+def test_unmeasured_memory_is_none_not_zero(programs, tmp_path):
+    sandbox = executor.Sandbox(tmp_path / "box")
+    sandbox.prepare(programs["sum"])
+    for _ in range(20):
+        memory_kb = run(sandbox, b"2\n")["memory_kb"]
+        assert memory_kb is None or memory_kb > 0
+
+def test_escaped_child_is_killed_but_judge_children_are_not(programs, tmp_path):
+    sandbox = executor.Sandbox(tmp_path / "box")
+    sandbox.prepare(programs["escape"])
+    seen = []
+
+    def consume(stdout):
+        # process ที่ judge fork แต่ยังไม่ exec (เหมือน worker อื่นที่กำลังเริ่มโปรแกรม) ถือทุก fd ของ judge รวมถึง pipe นี้
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(30)
+            os._exit(0)
+        seen.append(pid)
+        seen.append(stdout.read())
+        return True, ""
+
+    result = sandbox.run(b"", LIMITS, consume)
+    bystander, output = seen
+    # SIGKILL ไม่ได้มีผลทันที รอให้ process ที่ถูกฆ่าจบจริงก่อนตรวจ
+    time.sleep(0.2)
+    try:
+        assert result["killed_for"] is None
+        assert not alive(int(output))
+        assert alive(bystander)
+    finally:
+        os.kill(bystander, signal.SIGKILL)
+        os.waitpid(bystander, 0)
+
+def test_concurrent_runs_leave_each_other_alone(programs, tmp_path):
+    results = []
+
+    def escaping():
+        sandbox = executor.Sandbox(tmp_path / "a")
+        sandbox.prepare(programs["escape"])
+        for _ in range(10):
+            run(sandbox, b"")
+
+    def correct():
+        sandbox = executor.Sandbox(tmp_path / "b")
+        sandbox.prepare(programs["sum"])
+        for _ in range(40):
+            results.append(run(sandbox, b"2\n"))
+
+    threads = [threading.Thread(target=escaping), threading.Thread(target=correct)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r["ok"] and not r["killed_by_judge"] for r in results] == [True] * len(results)
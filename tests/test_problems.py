@@ -0,0 +1,29 @@
+import pytest
+
+from app.routers.problems import _parse_range
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-5000", (900, 999)),
+    # suffix: N ไบต์สุดท้าย
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("Bytes = 10-20", (10, 20)),
+])
+def test_satisfiable(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-100", "bytes=-0"])
+def test_unsatisfiable(header):
+    assert _parse_range(header, 1000) is None
+
+@pytest.mark.parametrize("header", [
+    # หลายช่วงไม่รองรับ ส่งทั้งไฟล์แทน
+    "bytes=0-10,20-30",
+    "items=0-10",
+    "bytes=abc-",
+    "bytes=10",
+])
+def test_ignored(header):
+    assert _parse_range(header, 1000) is False
@@ -0,0 +1,39 @@
+import shutil
+
+import pytest
+from sqlmodel import Session, func, select
+
+from app.db import engine
+from app.models import Submission
+from conftest import PDF, make_testcase_zip, wait_judged
+
+pytestmark = pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc to judge C submissions")
+
+SUM = b'#include <stdio.h>\nint main(){int a,b;scanf("%d %d",&a,&b);printf("%d\\n",a+b);}'
+
+@pytest.fixture(scope="module")
+def problem_id(app_client):
+    r = app_client.post("/problems/upload", data={"title": "Sum", "slug": "sum-rerun", "time_limit_ms": "1000"},
+                        files={"problem_pdf": ("p.pdf", PDF, "application/pdf"),
+                               "testcases_zip": ("t.zip", make_testcase_zip(), "application/zip")},
+                        follow_redirects=False)
+    assert r.status_code == 303, r.text
+    return int(r.headers["location"].rsplit("/", 1)[1])
+
+def submit(client, problem_id: int, source: bytes) -> int:
+    r = client.post("/submissions/submit", data={"problem_id": str(problem_id), "language": "c"},
+                    files={"source": ("main.c", source)}, follow_redirects=False)
+    assert r.status_code == 303, r.text
+    with Session(engine) as session:
+        return session.exec(select(func.max(Submission.id))).one()
+
+def test_rerun_requeues_and_judges_again(app_client, problem_id):
+    submission_id = submit(app_client, problem_id, SUM)
+    first = wait_judged(submission_id)
+    assert first.status == "accepted"
+
+    r = app_client.post(f"/submissions/{submission_id}/rerun", follow_redirects=False)
+    assert r.status_code == 303, r.text
+    again = wait_judged(submission_id)
+    assert again.status == "accepted"
+    assert again.updated_at > first.updated_at
@@ -0,0 +1,79 @@
+import json
+import zipfile
+
+import pytest
+
+from app.judge import testcases
+
+def write(prob_dir, files: dict):
+    for rel, content in files.items():
+        path = prob_dir / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+def test_natural_key_orders_numbers_by_value():
+    names = ["input10.txt", "input2.txt", "input1.txt", "inputa.txt"]
+    assert sorted(names, key=testcases.natural_key) == ["input1.txt", "input2.txt", "input10.txt", "inputa.txt"]
+
+def test_manifest_pairs_files_in_natural_order(tmp_path):
+    write(tmp_path, {
+        "input10.txt": b"10\n", "output10.txt": b"20\n",
+        "input2.txt": b"2\n", "output2.txt": b"4\n",
+        "sub/input1.txt": b"1\n", "sub/output1.txt": b"2\n",
+        "input3.txt": b"3\n",
+        "output4.txt": b"8\n",
+        # ไฟล์ของ version อื่นไม่ใช่ testcase ของ version 0
+        "versions/1/input1.txt": b"x\n", "versions/1/output1.txt": b"y\n",
+    })
+    manifest = testcases.build_manifest(tmp_path)
+    assert [t["input"] for t in manifest["tests"]] == ["input2.txt", "input10.txt", "sub/input1.txt"]
+    assert manifest["unmatched"] == ["input3.txt", "output4.txt"]
+    assert manifest["tests"][0]["output_size"] == 2
+    assert json.loads((tmp_path / testcases.MANIFEST_NAME).read_text()) == manifest
+
+def test_rebuilt_manifest_drops_cached_data(tmp_path):
+    write(tmp_path, {"input1.txt": b"1\n", "output1.txt": b"2\n"})
+    testcases.build_manifest(tmp_path)
+    tests, _ = testcases.get_testcases(tmp_path)
+    assert testcases.open_expected(tmp_path, tests[0]).read() == b"2\n"
+
+    write(tmp_path, {"output1.txt": b"3\n", "input2.txt": b"2\n", "output2.txt": b"4\n"})
+    testcases.build_manifest(tmp_path)
+    tests, _ = testcases.get_testcases(tmp_path)
+    assert len(tests) == 2
+    assert testcases.open_expected(tmp_path, tests[0]).read() == b"3\n"
+
+def make_zip(path, entries: dict):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, content in entries.items():
+            z.writestr(name, content)
+    return path
+
+def test_extract_zip_hashes_what_it_writes(tmp_path):
+    archive = make_zip(tmp_path / "t.zip", {"input1.txt": "1\n", "dir/": "", "dir/output1.txt": "2\n"})
+    files = testcases.extract_zip(archive, tmp_path / "out", prefix="v/")
+    assert sorted(files) == ["v/dir/output1.txt", "v/input1.txt"]
+    assert files["v/input1.txt"][0] == 2
+    assert (tmp_path / "out" / "dir" / "output1.txt").read_bytes() == b"2\n"
+
+@pytest.mark.parametrize("name", ["../evil.txt", "a/../../evil.txt", "/etc/evil.txt", "..\\evil.txt", "C:/evil.txt"])
+def test_extract_zip_rejects_paths_outside_the_target(tmp_path, name):
+    archive = make_zip(tmp_path / "t.zip", {"input1.txt": "1\n", name: "x"})
+    with pytest.raises(testcases.ArchiveError):
+        testcases.extract_zip(archive, tmp_path / "out" / "dest")
+    assert not list(tmp_path.rglob("evil.txt"))
+
+def test_extract_zip_limits(tmp_path, monkeypatch):
+    archive = make_zip(tmp_path / "t.zip", {f"input{i}.txt": "0" * 100 for i in range(5)})
+    monkeypatch.setattr(testcases, "EXTRACT_MAX_FILES", 4)
+    with pytest.raises(testcases.ArchiveError):
+        testcases.extract_zip(archive, tmp_path / "a")
+    monkeypatch.setattr(testcases, "EXTRACT_MAX_FILES", 10)
+    monkeypatch.setattr(testcases, "EXTRACT_MAX_BYTES", 250)
+    with pytest.raises(testcases.ArchiveError):
+        testcases.extract_zip(archive, tmp_path / "b")
+
+def test_extract_zip_rejects_non_zip(tmp_path):
+    (tmp_path / "t.zip").write_bytes(b"not a zip")
+    with pytest.raises(testcases.ArchiveError):
+        testcases.extract_zip(tmp_path / "t.zip", tmp_path / "out")